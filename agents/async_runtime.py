@@ -0,0 +1,97 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from agents.llm_cache import cached_completion_async
+from agents.core import get_async_client
+from agents.turn import Turn
+from agents.registry import ToolArgumentError
+from agents.telemetry import metrics, span
+
+load_dotenv()
+
+# Threads used to run the synchronous (database / HTTP) tools off the event loop
+TOOL_EXECUTOR_MAX_WORKERS = int(os.getenv("TOOL_EXECUTOR_MAX_WORKERS", "16"))
+
+tool_executor = ThreadPoolExecutor(max_workers=TOOL_EXECUTOR_MAX_WORKERS, thread_name_prefix="agent-tool")
+
+
+async def execute_tool_call_async(tool_call, registry, agent_name):
+    try:
+        compiled, args = registry.parse_tool_call(tool_call)
+    except ToolArgumentError as e:
+        print(f"{agent_name}:", "Rejected tool call:", f"{tool_call.function.name}({tool_call.function.arguments}): {e}")
+        metrics.inc("ufo_tool_rejections_total", 1, "Tool calls rejected for malformed arguments.", agent=agent_name)
+        return f"Error: {e}"
+
+    print(f"{agent_name}:", "Executing tool:", f"{compiled.name}({args})")
+
+    with span("tool", compiled.name, agent=agent_name):
+        if compiled.is_async:
+            return await compiled.func(**args)
+
+        # Run in a copy of the current context so the tool's database and splunk spans join this trace
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(tool_executor, functools.partial(context.run, compiled.func, **args))
+
+
+async def run_full_turn_async(agent, messages):
+    """
+    Asyncio version of run_full_turn.
+
+    The model is called through the async client and all tool calls of one
+    assistant message run concurrently; their results are appended in the
+    order the model requested them.
+    """
+
+    with span("turn", agent.name, agent=agent.name):
+        loop = asyncio.get_running_loop()
+
+        def off_loop(func, *args):
+            # Blocking work runs in a copy of the current context so its spans join this trace
+            return loop.run_in_executor(tool_executor, functools.partial(contextvars.copy_context().run, func, *args))
+
+        # The agent's prelude (e.g. the manager's pre-routed lookup) runs its tools off the event loop
+        prelude = await off_loop(agent.prelude_messages, messages)
+        turn = Turn(agent, messages, prelude)
+        while True:
+            # Building the request may reload the agent's reference data (e.g. the SOP catalog) from the database
+            request = await off_loop(turn.next_request)
+
+            with turn.llm_span() as llm_span:
+                response = await cached_completion_async(get_async_client(), executor=tool_executor, **request)
+                llm_span.record_usage(response.usage)
+
+            tool_calls = turn.add_message(response.choices[0].message)
+            if not tool_calls:  # if finished handling tool calls, break
+                break
+
+            results = await asyncio.gather(
+                *(execute_tool_call_async(tool_call, turn.agent.registry, turn.agent.name) for tool_call in tool_calls)
+            )
+            print(f"{len(results)} tool call(s) completed.")
+
+            for tool_call, result in zip(tool_calls, results):
+                turn.add_tool_result(tool_call, result)
+
+        return turn.response()
+
+
+async def run_conversations_async(agent, conversations, max_concurrency=8):
+    """
+    Runs one agent turn for each conversation concurrently, at most `max_concurrency` at a time.
+
+    Returns a Response, or the raised exception, per conversation in input order.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run_one(messages):
+        async with semaphore:
+            return await run_full_turn_async(agent, messages)
+
+    return await asyncio.gather(*(run_one(messages) for messages in conversations), return_exceptions=True)
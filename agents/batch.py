@@ -0,0 +1,179 @@
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from typing import Optional
+
+from dotenv import load_dotenv
+from pydantic import BaseModel
+
+load_dotenv()
+
+# Batch troubleshooting settings
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "8"))
+LLM_RATE_LIMIT_PER_SECOND = float(os.getenv("LLM_RATE_LIMIT_PER_SECOND", "4"))
+LLM_RATE_LIMIT_BURST = int(os.getenv("LLM_RATE_LIMIT_BURST", "8"))
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter.
+
+    Tokens refill continuously at `rate` per second up to `capacity`, so short
+    bursts go through immediately while the sustained rate stays bounded.
+    """
+
+    def __init__(self, rate, capacity):
+        if rate <= 0:
+            raise ValueError(f"rate must be positive, got {rate}")
+        if capacity < 1:
+            raise ValueError(f"capacity must be at least 1, got {capacity}")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def acquire(self, tokens=1, timeout=None):
+        """Blocks until `tokens` are available; returns False if `timeout` seconds pass first."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+
+class OrderResult(BaseModel):
+    order: str
+    status: str
+    duration_seconds: float
+    output: Optional[str] = None
+    error: Optional[str] = None
+    # Set when the order's resolution was queued but the resolution writer failed to write it
+    write_error: Optional[str] = None
+
+
+class BatchReport(BaseModel):
+    total: int
+    succeeded: int
+    failed: int
+    duration_seconds: float
+    results: list[OrderResult]
+
+    def summary(self):
+        durations = sorted(result.duration_seconds for result in self.results)
+        throughput = self.total / self.duration_seconds if self.duration_seconds else 0.0
+        lines = [
+            f"Processed {self.total} orders in {self.duration_seconds:.1f}s "
+            f"({throughput:.2f} orders/s): {self.succeeded} succeeded, {self.failed} failed",
+        ]
+        if durations:
+            median = durations[len(durations) // 2]
+            lines.append(f"Per-order latency: median {median:.1f}s, max {durations[-1]:.1f}s")
+        for result in self.results:
+            if result.status == "error":
+                lines.append(f"FAILED {result.order.split(',')[0]}: {result.error}")
+        return "\n".join(lines)
+
+
+def _run_one(order, process_order):
+    start = time.monotonic()
+    try:
+        output = process_order(order)
+        return OrderResult(
+            order=order,
+            status="success",
+            duration_seconds=time.monotonic() - start,
+            output=output,
+        )
+    except Exception as e:
+        traceback.print_exc()
+        return OrderResult(
+            order=order,
+            status="error",
+            duration_seconds=time.monotonic() - start,
+            error=f"{type(e).__name__}: {e}",
+        )
+
+
+def run_batch(orders, process_order, max_workers=BATCH_MAX_WORKERS, on_result=None):
+    """
+    Runs `process_order` for every order with at most `max_workers` in flight.
+
+    Orders are independent, so failures are captured per order instead of
+    aborting the batch. `on_result`, if given, is called with each OrderResult
+    as soon as it completes. Results in the report keep the input order.
+    """
+    orders = list(orders)
+    start = time.monotonic()
+    results = [None] * len(orders)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="troubleshoot") as executor:
+        futures = {
+            executor.submit(_run_one, order, process_order): index
+            for index, order in enumerate(orders)
+        }
+        for future in as_completed(futures):
+            result = future.result()
+            results[futures[future]] = result
+            if on_result is not None:
+                on_result(result)
+
+    succeeded = sum(1 for result in results if result.status == "success")
+    return BatchReport(
+        total=len(results),
+        succeeded=succeeded,
+        failed=len(results) - succeeded,
+        duration_seconds=time.monotonic() - start,
+        results=results,
+    )
+
+
+def iter_batch(orders, process_order, max_workers=BATCH_MAX_WORKERS, max_pending=None, stop=None):
+    """
+    Streaming variant of run_batch for arbitrarily long order iterables.
+
+    Orders are pulled from `orders` only as workers free up, with at most
+    `max_pending` (default 2 x max_workers) submitted at once, and each
+    OrderResult is yielded as soon as it completes, so memory use does not
+    grow with the number of orders. Results come in completion order.
+
+    Once `stop` (a threading.Event) is set no further orders are taken, but
+    the results of the orders already in flight are still yielded.
+    """
+    max_pending = max_pending or 2 * max_workers
+    orders = iter(orders)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="troubleshoot") as executor:
+        pending = set()
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < max_pending:
+                if stop is not None and stop.is_set():
+                    exhausted = True
+                    break
+                order = next(orders, None)
+                if order is None:
+                    exhausted = True
+                    break
+                pending.add(executor.submit(_run_one, order, process_order))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
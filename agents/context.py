@@ -0,0 +1,292 @@
+import json
+import os
+import threading
+
+from dotenv import load_dotenv
+from pydantic import BaseModel
+
+from agents.telemetry import metrics
+
+load_dotenv()
+
+# Token budget for everything sent in one model call (system prompt, tool schemas and messages)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "16000"))
+# Number of most recent messages that are always sent verbatim
+CONTEXT_RECENT_MESSAGES = int(os.getenv("CONTEXT_RECENT_MESSAGES", "8"))
+# Characters of an elided tool result kept as a preview
+CONTEXT_ELIDED_PREVIEW_CHARS = int(os.getenv("CONTEXT_ELIDED_PREVIEW_CHARS", "200"))
+
+# Rough characters-per-token ratio for Mistral tokenizers on mixed English / ID-heavy text
+CHARS_PER_TOKEN = 4
+
+ELIDED_MARKER = "[Earlier"
+
+
+def estimate_tokens(text):
+    if not text:
+        return 0
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def as_message_dict(message):
+    """Returns a chat message as a plain dict, whether it is a dict or an OpenAI message object."""
+    if isinstance(message, dict):
+        return message
+    return message.model_dump(exclude_none=True)
+
+
+def message_tokens(message):
+    message = as_message_dict(message)
+    tokens = 4 + estimate_tokens(message.get("content") if isinstance(message.get("content"), str) else json.dumps(message.get("content"), default=str))
+    for tool_call in message.get("tool_calls") or []:
+        function = tool_call.get("function") or {}
+        tokens += estimate_tokens(function.get("name")) + estimate_tokens(function.get("arguments"))
+    return tokens
+
+
+class ContextBudgetError(ValueError):
+    """Raised when the system prompt and tool schemas alone do not fit in the token budget."""
+
+
+class ContextReport(BaseModel):
+    original_tokens: int
+    final_tokens: int
+    elided_tool_results: int = 0
+    summarized_messages: int = 0
+    trimmed_summary_lines: int = 0
+    dropped_messages: int = 0
+    truncated_messages: int = 0
+
+    @property
+    def saved_tokens(self):
+        return self.original_tokens - self.final_tokens
+
+
+def _preview(text, limit):
+    text = " ".join(str(text or "").split())
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+def _elide_tool_result(message, preview_chars):
+    content = str(message.get("content") or "")
+    elided = dict(message)
+    elided["content"] = (
+        f"{ELIDED_MARKER} {message.get('name', 'tool')} result elided ({len(content)} chars). "
+        f"Preview: {_preview(content, preview_chars)}]"
+    )
+    return elided
+
+
+def _summarize(messages, preview_chars, max_tokens):
+    """
+    Returns (summary, number of lines left out); the oldest lines are left out first so the
+    summary fits in max_tokens. The summary is empty when not even one line fits.
+    """
+    lines = []
+    for message in messages:
+        role = message.get("role")
+        if role == "user":
+            lines.append(f"- User: {_preview(message.get('content'), preview_chars)}")
+        elif role == "assistant":
+            for tool_call in message.get("tool_calls") or []:
+                function = tool_call.get("function") or {}
+                lines.append(f"- Assistant called {function.get('name')}({_preview(function.get('arguments'), preview_chars)})")
+            if message.get("content"):
+                lines.append(f"- Assistant: {_preview(message.get('content'), preview_chars)}")
+        elif role == "tool":
+            lines.append(f"- {message.get('name', 'tool')} returned: {_preview(message.get('content'), preview_chars // 2)}")
+
+    header = "Summary of the earlier conversation:\n"
+    tokens = estimate_tokens(header)
+    kept = []
+    for line in reversed(lines):
+        line_tokens = len(line) // CHARS_PER_TOKEN + 1
+        if tokens + line_tokens > max_tokens:
+            break
+        kept.append(line)
+        tokens += line_tokens
+    if not kept:
+        return "", len(lines)
+    return header + "\n".join(reversed(kept)), len(lines) - len(kept)
+
+
+class ContextBudget:
+    """
+    Keeps the prompt of every model call within a token budget.
+
+    Applied in stages until the prompt fits:
+      1. tool results older than the recent window are replaced by a short preview
+      2. turns older than the recent window are folded into an extractive summary,
+         prepended to the first message kept verbatim; the summary is capped at the
+         budget the window leaves, dropping its oldest lines first
+      3. tool results inside the recent window, except those answering the latest
+         assistant message, are elided as well
+      4. the oldest turns of the window (with the summary) are dropped, always
+         keeping the turn of the latest user message
+      5. message contents are cut down, oldest first, until the prompt fits
+    The conversation history itself is never modified, only the copy sent to the model.
+    """
+
+    def __init__(self, budget=CONTEXT_TOKEN_BUDGET, recent_messages=CONTEXT_RECENT_MESSAGES,
+                 preview_chars=CONTEXT_ELIDED_PREVIEW_CHARS):
+        self.budget = budget
+        self.recent_messages = recent_messages
+        self.preview_chars = preview_chars
+        self._lock = threading.Lock()
+        self._totals = {
+            "calls": 0,
+            "compacted_calls": 0,
+            "tokens_saved": 0,
+            "elided_tool_results": 0,
+            "summarized_messages": 0,
+            "trimmed_summary_lines": 0,
+            "dropped_messages": 0,
+            "truncated_messages": 0,
+            "max_final_tokens": 0,
+        }
+
+    def _window_start(self, messages):
+        # The verbatim window must start at a user message so that an assistant
+        # tool call is never separated from its tool results; it always holds
+        # at least the latest message
+        if not messages:
+            return 0
+        start = min(max(0, len(messages) - self.recent_messages), len(messages) - 1)
+        while start > 0 and messages[start].get("role") != "user":
+            start -= 1
+        return start
+
+    def apply(self, instructions, messages, tool_schemas=None):
+        """Returns (messages to send including the system prompt, ContextReport)."""
+        messages = [as_message_dict(message) for message in messages]
+        fixed_tokens = estimate_tokens(instructions) + estimate_tokens(json.dumps(tool_schemas or []))
+        available = self.budget - fixed_tokens
+        if available < 0:
+            raise ContextBudgetError(
+                f"System prompt and tool schemas take {fixed_tokens} tokens, over the budget of {self.budget}"
+            )
+
+        def total(candidate):
+            return sum(message_tokens(message) for message in candidate)
+
+        original_tokens = fixed_tokens + total(messages)
+        report = ContextReport(original_tokens=original_tokens, final_tokens=original_tokens)
+
+        if total(messages) > available:
+            start = self._window_start(messages)
+            old, recent = messages[:start], messages[start:]
+
+            # Stage 1: elide stale tool results
+            compacted = []
+            for message in old:
+                if message.get("role") == "tool":
+                    compacted.append(_elide_tool_result(message, self.preview_chars))
+                    report.elided_tool_results += 1
+                else:
+                    compacted.append(message)
+            candidate = compacted + recent
+
+            # Stage 2: fold old turns into a summary, capped at what the window leaves of the budget
+            if total(candidate) > available and old and recent:
+                summary, left_out = _summarize(old, self.preview_chars, available - total(recent))
+                first = dict(recent[0])
+                if summary:
+                    first["content"] = summary + "\n\n" + str(first.get("content") or "")
+                candidate = [first] + recent[1:]
+                report.summarized_messages = len(old)
+                report.trimmed_summary_lines = left_out
+
+            # Stage 3: elide tool results in the window that the latest assistant message does not depend on
+            if total(candidate) > available:
+                last_assistant = max(
+                    (index for index, message in enumerate(candidate) if message.get("role") == "assistant"),
+                    default=len(candidate),
+                )
+                elided = []
+                for index, message in enumerate(candidate):
+                    if (
+                        message.get("role") == "tool"
+                        and index < last_assistant
+                        and not str(message.get("content") or "").startswith(ELIDED_MARKER)
+                    ):
+                        message = _elide_tool_result(message, self.preview_chars)
+                        report.elided_tool_results += 1
+                    elided.append(message)
+                candidate = elided
+
+            # Stage 4: drop the oldest turns, one user message at a time
+            while total(candidate) > available:
+                next_turn = next(
+                    (index for index, message in enumerate(candidate) if index > 0 and message.get("role") == "user"),
+                    None,
+                )
+                if next_turn is None:
+                    break
+                report.dropped_messages += next_turn
+                candidate = candidate[next_turn:]
+
+            # Stage 5: cut message contents down, previews first, then the largest content
+            if total(candidate) > available:
+                candidate = self._truncate(candidate, available, total, report)
+
+            messages = candidate
+            report.final_tokens = fixed_tokens + total(messages)
+
+        assert report.final_tokens <= self.budget, (report.final_tokens, self.budget)
+
+        with self._lock:
+            self._totals["calls"] += 1
+            if report.saved_tokens > 0:
+                self._totals["compacted_calls"] += 1
+                self._totals["tokens_saved"] += report.saved_tokens
+            for stat in ("elided_tool_results", "summarized_messages", "trimmed_summary_lines",
+                         "dropped_messages", "truncated_messages"):
+                self._totals[stat] += getattr(report, stat)
+            self._totals["max_final_tokens"] = max(self._totals["max_final_tokens"], report.final_tokens)
+
+        if report.saved_tokens > 0:
+            print(
+                f"Context compacted: {report.original_tokens} -> {report.final_tokens} tokens "
+                f"(saved {report.saved_tokens}, elided {report.elided_tool_results} tool results, "
+                f"summarized {report.summarized_messages} messages, dropped {report.dropped_messages}, "
+                f"truncated {report.truncated_messages})"
+            )
+
+        return [{"role": "system", "content": instructions}] + messages, report
+
+    def _truncate(self, messages, available, total, report):
+        messages = list(messages)
+        # The latest message is only ever cut as far as needed
+        for index, message in enumerate(messages[:-1]):
+            if total(messages) <= available:
+                return messages
+            content = message.get("content")
+            if not isinstance(content, str) or len(content) <= self.preview_chars:
+                continue
+            if message.get("role") == "tool":
+                messages[index] = _elide_tool_result(message, self.preview_chars)
+            else:
+                messages[index] = dict(message, content=_preview(content, self.preview_chars))
+            report.truncated_messages += 1
+
+        while total(messages) > available:
+            index, message = max(
+                enumerate(messages), key=lambda item: len(item[1].get("content") or "") if isinstance(item[1].get("content"), str) else 0
+            )
+            content = message.get("content")
+            if not isinstance(content, str) or not content:
+                raise ContextBudgetError(
+                    f"Messages still take {total(messages)} tokens with every content cut, over the {available} available"
+                )
+            excess_chars = (total(messages) - available) * CHARS_PER_TOKEN
+            messages[index] = dict(message, content=content[:max(0, len(content) - excess_chars - CHARS_PER_TOKEN)])
+            report.truncated_messages += 1
+        return messages
+
+    def stats(self):
+        with self._lock:
+            return dict(self._totals)
+
+
+context_budget = ContextBudget()
+metrics.register_collector("ufo_context", context_budget.stats)
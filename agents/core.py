@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Callable, Optional
+
+from dotenv import load_dotenv
+from pydantic import BaseModel, PrivateAttr
+
+from agents.registry import ToolArgumentError, ToolRegistry
+from agents.telemetry import metrics, span
+
+load_dotenv()
+
+MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
+MISTRAL_MODEL = os.getenv("MISTRAL_MODEL")
+MISTRAL_BASE_URL = os.getenv("MISTRAL_BASE_URL")
+
+_client = None
+_async_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Returns the OpenAI-compatible client for the Mistral endpoint, created on first use.
+
+    The client (and the openai package) are only loaded once a model call is
+    made, so importing the agent modules stays cheap.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import httpx
+                from openai import OpenAI
+
+                # Use this for local only, connect to Mistral Free API
+                # from mistralai import Mistral
+                # _client = Mistral(
+                #     api_key = MISTRAL_API_KEY,
+                # )
+
+                # Use this for server
+                _client = OpenAI(
+                    api_key = MISTRAL_API_KEY,
+                    base_url = MISTRAL_BASE_URL,
+                    http_client = httpx.Client(verify=False),
+                )
+    return _client
+
+
+def get_async_client():
+    """Async counterpart of get_client, for the asyncio runtime."""
+    global _async_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                import httpx
+                from openai import AsyncOpenAI
+
+                _async_client = AsyncOpenAI(
+                    api_key = MISTRAL_API_KEY,
+                    base_url = MISTRAL_BASE_URL,
+                    http_client = httpx.AsyncClient(verify=False),
+                )
+    return _async_client
+
+
+class Agent(BaseModel):
+    name: str = "Agent"
+    model: str = MISTRAL_MODEL
+    instructions: str = "You are a helpful Agent"
+    tools: list = []
+    # Static reference data appended to the instructions, e.g. the SOP catalog
+    reference: Optional[Callable[[], str]] = None
+    # Called with (agent, messages) at the start of a turn; returns messages to add before the
+    # first model call, e.g. tool calls run in code with seeded_tool_call
+    prelude: Optional[Callable[..., list]] = None
+
+    _registry: ToolRegistry = PrivateAttr()
+
+    def model_post_init(self, __context):
+        # Tool schemas and argument validators are compiled once per agent, not per model call
+        self._registry = ToolRegistry(self.tools)
+
+    @property
+    def registry(self) -> ToolRegistry:
+        return self._registry
+
+    def system_prompt(self):
+        """
+        Returns the system prompt: the instructions followed by the reference data.
+
+        Together with the tool schemas it forms the leading prefix of every
+        model call, so it must stay byte-identical between calls for the
+        model server's prefix cache to reuse it; per-order data goes in the
+        messages after it.
+        """
+        if self.reference is None:
+            return self.instructions
+        return self.instructions + "\n\n" + self.reference()
+
+    def prelude_messages(self, messages):
+        if self.prelude is None:
+            return []
+        return self.prelude(self, messages)
+
+
+class Response(BaseModel):
+    agent: Optional[Agent]
+    messages: list
+
+
+def execute_tool_call(tool_call, registry, agent_name):
+    """
+    Validates and runs a tool call from the model.
+
+    Malformed arguments never reach the tool; the validation error is returned
+    as the tool result so the model can correct the call.
+    """
+    try:
+        compiled, args = registry.parse_tool_call(tool_call)
+    except ToolArgumentError as e:
+        print(f"{agent_name}:", "Rejected tool call:", f"{tool_call.function.name}({tool_call.function.arguments}): {e}")
+        metrics.inc("ufo_tool_rejections_total", 1, "Tool calls rejected for malformed arguments.", agent=agent_name)
+        return f"Error: {e}"
+
+    print(f"{agent_name}:", "Executing tool:", f"{compiled.name}({args})")
+
+    with span("tool", compiled.name, agent=agent_name):
+        return compiled.func(**args)
+
+
+def tool_call_id(name, arguments):
+    """
+    Returns the ID of a tool call run in code, derived from the tool name and its arguments.
+
+    Mistral only accepts tool call IDs of 9 alphanumeric characters. The same call always
+    gets the same ID, so identical turns send identical prompts and hit the completion cache.
+    """
+    canonical = json.dumps(arguments, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(f"{name}:{canonical}".encode("utf-8")).hexdigest()[:9]
+
+
+def seeded_tool_call(agent, name, arguments, **span_attributes):
+    """
+    Runs a tool call decided in code instead of by the model, e.g. a pre-routed lookup.
+
+    Returns the assistant tool call message and the tool result message that record it
+    in the conversation, as if the model had made the call.
+    """
+    encoded = json.dumps(arguments)
+    print(f"{agent.name}:", "Seeded tool:", f"{name}({encoded})")
+    with span("tool", name, agent=agent.name, **span_attributes):
+        result = agent.registry.get(name).func(**arguments)
+
+    call_id = tool_call_id(name, arguments)
+    return [
+        {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{"id": call_id, "type": "function", "function": {"name": name, "arguments": encoded}}],
+        },
+        {"role": "tool", "tool_call_id": call_id, "name": name, "content": result},
+    ]
@@ -0,0 +1,206 @@
+import atexit
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool as pg_pool
+from dotenv import load_dotenv
+
+from agents.telemetry import metrics
+
+load_dotenv()
+
+# Database connection constants
+DB_HOST = os.getenv("DB_HOST")
+DB_DATABASE = os.getenv("DB_DATABASE")
+DB_USER = os.getenv("DB_USER")
+DB_PASSWORD = os.getenv("DB_PASSWORD")
+DB_PORT = os.getenv("DB_PORT")
+
+# Connection pool settings
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_HEALTH_CHECK_INTERVAL = float(os.getenv("DB_POOL_HEALTH_CHECK_INTERVAL", "30"))
+
+
+class PoolTimeoutError(pg_pool.PoolError):
+    """Raised when no pooled connection becomes available within the checkout timeout."""
+
+
+class ConnectionPool:
+    """
+    Thread-safe PostgreSQL connection pool shared by every agent tool.
+
+    Wraps psycopg2's ThreadedConnectionPool with a bounded checkout wait
+    (instead of failing immediately when exhausted), a liveness check for
+    connections that sat idle longer than the health check interval, and
+    basic usage statistics.
+    """
+
+    def __init__(self, min_size, max_size, timeout, health_check_interval, **connect_kwargs):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.pid = os.getpid()
+
+        self._pool = pg_pool.ThreadedConnectionPool(min_size, max_size, **connect_kwargs)
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._last_used = {}
+        self._stats = {
+            "checkouts": 0,
+            "timeouts": 0,
+            "health_check_failures": 0,
+            "in_use": 0,
+            "total_wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+        }
+
+    def getconn(self):
+        start = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise PoolTimeoutError(
+                f"Timed out after {self.timeout}s waiting for a database connection "
+                f"(pool max size {self.max_size})"
+            )
+
+        try:
+            connection = self._checkout_healthy()
+        except Exception:
+            self._slots.release()
+            raise
+
+        waited = time.monotonic() - start
+        with self._lock:
+            self._stats["checkouts"] += 1
+            self._stats["in_use"] += 1
+            self._stats["total_wait_seconds"] += waited
+            self._stats["max_wait_seconds"] = max(self._stats["max_wait_seconds"], waited)
+        return connection
+
+    def putconn(self, connection, close=False):
+        with self._lock:
+            self._last_used[id(connection)] = time.monotonic()
+            self._stats["in_use"] -= 1
+        try:
+            self._pool.putconn(connection, close=close or bool(connection.closed))
+        finally:
+            self._slots.release()
+
+    def _checkout_healthy(self):
+        connection = self._pool.getconn()
+        if not connection.closed and not self._needs_health_check(connection):
+            return connection
+
+        try:
+            if connection.closed:
+                raise psycopg2.InterfaceError("connection already closed")
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.rollback()
+            return connection
+        except psycopg2.Error as e:
+            print(f"Discarding broken pooled connection: {e}")
+            with self._lock:
+                self._stats["health_check_failures"] += 1
+                self._last_used.pop(id(connection), None)
+            self._pool.putconn(connection, close=True)
+            return self._pool.getconn()
+
+    def _needs_health_check(self, connection):
+        with self._lock:
+            last_used = self._last_used.get(id(connection))
+        if last_used is None:
+            return False
+        return time.monotonic() - last_used >= self.health_check_interval
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["min_size"] = self.min_size
+        stats["max_size"] = self.max_size
+        stats["idle"] = len(self._pool._pool)
+        stats["avg_wait_seconds"] = (
+            stats["total_wait_seconds"] / stats["checkouts"] if stats["checkouts"] else 0.0
+        )
+        return stats
+
+    def close(self):
+        self._pool.closeall()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Returns the process-wide connection pool, creating it on first use.
+
+    The pool is rebuilt after a fork so that worker processes never share
+    sockets with their parent.
+    """
+    global _pool
+    if _pool is None or _pool.pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool.pid != os.getpid():
+                _pool = ConnectionPool(
+                    DB_POOL_MIN_SIZE,
+                    DB_POOL_MAX_SIZE,
+                    DB_POOL_TIMEOUT,
+                    DB_POOL_HEALTH_CHECK_INTERVAL,
+                    host=DB_HOST,
+                    database=DB_DATABASE,
+                    user=DB_USER,
+                    password=DB_PASSWORD,
+                    port=DB_PORT,
+                )
+    return _pool
+
+
+@contextmanager
+def get_connection():
+    """
+    Checks out a pooled connection for the duration of a with-block.
+
+    Any open transaction is rolled back when the connection is returned, so
+    callers that write must commit explicitly.
+    """
+    pool = get_pool()
+    connection = pool.getconn()
+    try:
+        yield connection
+    except Exception:
+        if not connection.closed:
+            try:
+                connection.rollback()
+            except psycopg2.Error:
+                pass
+        raise
+    finally:
+        pool.putconn(connection)
+
+
+def pool_stats():
+    """Returns the connection pool statistics, or an empty dict if the pool was never used."""
+    if _pool is None:
+        return {}
+    return _pool.stats()
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool.pid == os.getpid():
+            _pool.close()
+        _pool = None
+
+
+atexit.register(close_pool)
+metrics.register_collector("ufo_db_pool", pool_stats)
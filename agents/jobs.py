@@ -0,0 +1,269 @@
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from dotenv import load_dotenv
+from pydantic import BaseModel
+
+from agents.batch import iter_batch
+from agents.manager import run_full_turn_stream
+from agents.troubleshooting import troubleshoot_order
+from agents.writer import resolution_writer
+
+load_dotenv()
+
+# Background jobs started from the UI
+JOB_MAX_WORKERS = int(os.getenv("JOB_MAX_WORKERS", "8"))
+JOB_MAX_ACTIVE_PER_USER = int(os.getenv("JOB_MAX_ACTIVE_PER_USER", "2"))
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = {SUCCEEDED, FAILED, CANCELLED}
+
+
+class JobLimitError(Exception):
+    """Raised when a user already has the maximum number of queued or running jobs."""
+
+
+class JobNotFoundError(LookupError):
+    """Raised for an unknown (or already purged) job ID."""
+
+
+class JobStatus(BaseModel):
+    id: str
+    kind: str
+    user_id: str
+    state: str
+    progress: int
+    total: Optional[int] = None
+    events: int
+    error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def finished(self):
+        return self.state in FINISHED_STATES
+
+
+class Job:
+    """
+    One unit of background work and everything the UI polls for.
+
+    Workers append events (partial results) with emit(); readers fetch the
+    ones they have not seen yet with events(since). Cancellation is
+    cooperative: the worker checks cancel_requested between events.
+    """
+
+    def __init__(self, kind, user_id, total=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.user_id = user_id
+        self.total = total
+        self.state = QUEUED
+        self.progress = 0
+        self.error = None
+        self.result = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_requested = threading.Event()
+        self._events = []
+        self._lock = threading.Lock()
+
+    def emit(self, event):
+        with self._lock:
+            self._events.append(event)
+
+    def advance(self, steps=1):
+        with self._lock:
+            self.progress += steps
+
+    def events(self, since=0):
+        """Returns the events emitted after the first `since` ones."""
+        with self._lock:
+            return self._events[since:]
+
+    def start(self):
+        with self._lock:
+            self.state = RUNNING
+            self.started_at = time.time()
+
+    def finish(self, state, error=None):
+        with self._lock:
+            self.state = state
+            self.error = error
+            self.finished_at = time.time()
+
+    def status(self):
+        with self._lock:
+            return JobStatus(
+                id=self.id,
+                kind=self.kind,
+                user_id=self.user_id,
+                state=self.state,
+                progress=self.progress,
+                total=self.total,
+                events=len(self._events),
+                error=self.error,
+                created_at=self.created_at,
+                started_at=self.started_at,
+                finished_at=self.finished_at,
+            )
+
+
+def _run_turn(job, agent, messages):
+    """Runs one agent turn, publishing the streamed events; returns the turn's Response."""
+    stream = run_full_turn_stream(agent, messages)
+    try:
+        for event in stream:
+            if job.cancel_requested.is_set():
+                return None
+            if event["type"] == "done":
+                return event["response"]
+            job.emit(event)
+            if event["type"] == "message":
+                job.advance()
+    finally:
+        stream.close()
+
+
+def _run_batch(job, orders):
+    """
+    Troubleshoots a list of orders, publishing each OrderResult as it completes.
+
+    On cancel no further orders are started, but the orders already in flight
+    are finished and their results published too.
+
+    Resolutions are written in the background, so write failures are only known
+    once the writer is flushed; they are then set on the affected orders' results.
+    """
+    started = time.time()
+    ih_numbers = {order.split(",")[0] for order in orders}
+    by_ih_number = {}
+    results = iter_batch(orders, troubleshoot_order, stop=job.cancel_requested)
+    try:
+        for result in results:
+            by_ih_number[result.order.split(",")[0]] = result
+            job.emit({"type": "order_result", "result": result})
+            job.advance()
+    finally:
+        results.close()
+        resolution_writer.flush()
+        # Other jobs may have written in the same window; only this job's orders are considered
+        failures = [failure for failure in resolution_writer.failures(since=started)
+                    if failure["row"]["ih_number"] in ih_numbers]
+        for failure in failures:
+            result = by_ih_number.get(failure["row"]["ih_number"])
+            if result is not None:
+                result.write_error = failure["error"]
+
+
+class JobQueue:
+    """
+    In-process background job queue for agent turns and troubleshooting batches.
+
+    Jobs run on a bounded worker pool, so long turns and batches no longer
+    hold a Streamlit script thread. Each user may have at most
+    `max_active_per_user` queued or running jobs; finished jobs are kept for
+    `retention` seconds so their results can still be polled.
+    """
+
+    def __init__(self, max_workers=JOB_MAX_WORKERS, max_active_per_user=JOB_MAX_ACTIVE_PER_USER,
+                 retention=JOB_RETENTION_SECONDS):
+        self.max_workers = max_workers
+        self.max_active_per_user = max_active_per_user
+        self.retention = retention
+        self._executor = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _purge(self):
+        cutoff = time.time() - self.retention
+        for job_id, job in list(self._jobs.items()):
+            if job.finished_at is not None and job.finished_at < cutoff:
+                del self._jobs[job_id]
+
+    def _submit(self, job, target, *args):
+        with self._lock:
+            self._purge()
+            active = sum(
+                1 for other in self._jobs.values()
+                if other.user_id == job.user_id and other.state not in FINISHED_STATES
+            )
+            if active >= self.max_active_per_user:
+                raise JobLimitError(
+                    f"User {job.user_id} already has {active} active jobs (limit {self.max_active_per_user})"
+                )
+            self._jobs[job.id] = job
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="agent-job")
+            executor = self._executor
+        executor.submit(self._run, job, target, *args)
+        return job.id
+
+    def _run(self, job, target, *args):
+        if job.cancel_requested.is_set():
+            job.finish(CANCELLED)
+            return
+        job.start()
+        try:
+            job.result = target(job, *args)
+        except Exception as e:
+            traceback.print_exc()
+            job.finish(FAILED, f"{type(e).__name__}: {e}")
+            return
+        job.finish(CANCELLED if job.cancel_requested.is_set() else SUCCEEDED)
+
+    def submit_turn(self, user_id, agent, messages):
+        """Queues one agent turn over `messages`; the job result is the turn's Response."""
+        return self._submit(Job("turn", user_id), _run_turn, agent, list(messages))
+
+    def submit_batch(self, user_id, orders):
+        """Queues a troubleshooting batch over order rows in the order_header format."""
+        orders = list(orders)
+        return self._submit(Job("batch", user_id, total=len(orders)), _run_batch, orders)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            raise JobNotFoundError(f"Unknown job {job_id}")
+        return job
+
+    def status(self, job_id):
+        return self.get(job_id).status()
+
+    def events(self, job_id, since=0):
+        return self.get(job_id).events(since)
+
+    def cancel(self, job_id):
+        """Requests cancellation; a queued job never starts, a running one stops at its next event."""
+        self.get(job_id).cancel_requested.set()
+
+    def jobs(self, user_id=None):
+        """Returns the status of every retained job, optionally only the given user's, newest first."""
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if user_id is None or job.user_id == user_id]
+        return sorted((job.status() for job in jobs), key=lambda status: status.created_at, reverse=True)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            job.cancel_requested.set()
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+job_queue = JobQueue()
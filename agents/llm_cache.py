@@ -0,0 +1,300 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from agents.telemetry import current_span, metrics
+
+load_dotenv()
+
+# Persistent cache of deterministic (temperature 0) chat completions
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(".cache", "llm_cache.sqlite3"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+
+# Completions that call one of these tools are never cached, so a write is always decided by a fresh model call
+WRITE_TOOLS = {"update_order_resolution", "retry_order", "force_complete_order"}
+
+
+def request_key(request):
+    """Stable hash of a chat completion request (model, messages incl. system prompt, tools, sampling params)."""
+    canonical = json.dumps(request, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def calls_write_tool(response):
+    message = response.choices[0].message
+    return any(tool_call.function.name in WRITE_TOOLS for tool_call in message.tool_calls or [])
+
+
+class CompletionCache:
+    """
+    SQLite-backed completion cache with TTL expiry and least-recently-used eviction.
+
+    Safe to share between threads, and between processes through SQLite's WAL
+    mode (e.g. the Streamlit app and a troubleshooting batch).
+    """
+
+    def __init__(self, path=LLM_CACHE_PATH, max_entries=LLM_CACHE_MAX_ENTRIES, ttl=LLM_CACHE_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._connection = None
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "skipped_writes": 0, "evictions": 0, "bypassed": 0}
+
+    def _connect(self):
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS completions (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS completions_last_access ON completions (last_access)")
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute(
+                "SELECT response, created_at FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    connection.execute("DELETE FROM completions WHERE key = ?", (key,))
+                    connection.commit()
+                self._stats["misses"] += 1
+                return None
+            connection.execute("UPDATE completions SET last_access = ? WHERE key = ?", (now, key))
+            connection.commit()
+            self._stats["hits"] += 1
+        # Imported here so that importing the cache does not load the openai package
+        from openai.types.chat import ChatCompletion
+
+        return ChatCompletion.model_validate_json(row[0])
+
+    def put(self, key, response):
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                "INSERT OR REPLACE INTO completions (key, response, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, response.model_dump_json(), now, now),
+            )
+            count = connection.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+            if count > self.max_entries:
+                evicted = connection.execute(
+                    "DELETE FROM completions WHERE key IN "
+                    "(SELECT key FROM completions ORDER BY last_access LIMIT ?)",
+                    (count - self.max_entries,),
+                ).rowcount
+                self._stats["evictions"] += evicted
+            connection.commit()
+            self._stats["stores"] += 1
+
+    def record(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = self._connect().execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self._lock:
+            connection = self._connect()
+            connection.execute("DELETE FROM completions")
+            connection.commit()
+
+
+completion_cache = CompletionCache()
+metrics.register_collector("ufo_llm_cache", completion_cache.stats)
+
+
+def _is_cacheable(request, bypass):
+    return (
+        LLM_CACHE_ENABLED
+        and not bypass
+        and not request.get("stream")
+        and request.get("temperature") == 0
+    )
+
+
+def cached_completion(client, bypass=False, **request):
+    """
+    client.chat.completions.create with the persistent cache in front of it.
+
+    Only deterministic (temperature 0, non-streaming) requests are cached. Pass
+    bypass=True to always call the model.
+    """
+    if not _is_cacheable(request, bypass):
+        if LLM_CACHE_ENABLED:
+            completion_cache.record("bypassed")
+        return client.chat.completions.create(**request)
+
+    key = request_key(request)
+    response = completion_cache.get(key)
+    current_span().set(cache="miss" if response is None else "hit")
+    if response is not None:
+        return response
+
+    response = client.chat.completions.create(**request)
+    if calls_write_tool(response):
+        completion_cache.record("skipped_writes")
+    else:
+        completion_cache.put(key, response)
+    return response
+
+
+def _replay_chunks(response):
+    """Replays a stored completion as a stream: one delta for the content, then one with the tool calls."""
+    from openai.types.chat import ChatCompletionChunk
+
+    choice = response.choices[0]
+    message = choice.message
+    base = {"id": response.id, "object": "chat.completion.chunk", "created": response.created, "model": response.model}
+    deltas = [{"role": "assistant", "content": message.content or ""}]
+    if message.tool_calls:
+        deltas.append({"tool_calls": [
+            {"index": index, "id": tool_call.id, "type": "function",
+             "function": {"name": tool_call.function.name, "arguments": tool_call.function.arguments}}
+            for index, tool_call in enumerate(message.tool_calls)
+        ]})
+    for position, delta in enumerate(deltas):
+        finish_reason = choice.finish_reason if position == len(deltas) - 1 else None
+        yield ChatCompletionChunk.model_validate(
+            dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": finish_reason}])
+        )
+    if response.usage is not None:
+        yield ChatCompletionChunk.model_validate(dict(base, choices=[], usage=response.usage.model_dump()))
+
+
+def completion_from_chunks(chunks):
+    """Builds the ChatCompletion a non-streaming call would have returned from the streamed chunks."""
+    from openai.types.chat import ChatCompletion
+
+    content = ""
+    tool_calls = {}
+    finish_reason = "stop"
+    usage = None
+    for chunk in chunks:
+        if getattr(chunk, "usage", None):
+            usage = chunk.usage.model_dump()
+        if not chunk.choices:
+            continue
+        choice = chunk.choices[0]
+        if choice.finish_reason:
+            finish_reason = choice.finish_reason
+        if choice.delta.content:
+            content += choice.delta.content
+        for tool_call_delta in choice.delta.tool_calls or []:
+            tool_call = tool_calls.setdefault(tool_call_delta.index, {"id": None, "name": "", "arguments": ""})
+            if tool_call_delta.id:
+                tool_call["id"] = tool_call_delta.id
+            if tool_call_delta.function:
+                tool_call["name"] += tool_call_delta.function.name or ""
+                tool_call["arguments"] += tool_call_delta.function.arguments or ""
+
+    message = {"role": "assistant", "content": content or None}
+    if tool_calls:
+        message["tool_calls"] = [
+            {"id": tool_call["id"], "type": "function",
+             "function": {"name": tool_call["name"], "arguments": tool_call["arguments"] or "{}"}}
+            for _, tool_call in sorted(tool_calls.items())
+        ]
+    return ChatCompletion.model_validate({
+        "id": chunks[0].id,
+        "object": "chat.completion",
+        "created": chunks[0].created,
+        "model": chunks[0].model,
+        "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+        "usage": usage,
+    })
+
+
+def cached_completion_stream(client, bypass=False, **request):
+    """
+    Streaming counterpart of cached_completion; yields chat completion chunks.
+
+    Streamed and non-streamed requests share cache entries. A hit is replayed as
+    a short synthetic stream; on a miss the chunks are passed through as they
+    arrive and the assembled completion is stored once the stream has been read
+    to the end, under the same policy (never for completions calling WRITE_TOOLS).
+    """
+    unstreamed = {key: value for key, value in request.items() if key not in ("stream", "stream_options")}
+    if not _is_cacheable(unstreamed, bypass):
+        if LLM_CACHE_ENABLED:
+            completion_cache.record("bypassed")
+        yield from client.chat.completions.create(**request)
+        return
+
+    key = request_key(unstreamed)
+    response = completion_cache.get(key)
+    current_span().set(cache="miss" if response is None else "hit")
+    if response is not None:
+        yield from _replay_chunks(response)
+        return
+
+    chunks = []
+    for chunk in client.chat.completions.create(**request):
+        chunks.append(chunk)
+        yield chunk
+    if not chunks:
+        return
+
+    response = completion_from_chunks(chunks)
+    if calls_write_tool(response):
+        completion_cache.record("skipped_writes")
+    else:
+        completion_cache.put(key, response)
+
+
+async def cached_completion_async(client, bypass=False, executor=None, **request):
+    """
+    Async counterpart of cached_completion for the AsyncOpenAI client.
+
+    The cache is a blocking SQLite database, so keys are computed and entries
+    read and written in `executor` (the loop's default executor if None),
+    never on the event loop itself.
+    """
+    if not _is_cacheable(request, bypass):
+        if LLM_CACHE_ENABLED:
+            completion_cache.record("bypassed")
+        return await client.chat.completions.create(**request)
+
+    loop = asyncio.get_running_loop()
+    key = await loop.run_in_executor(executor, request_key, request)
+    response = await loop.run_in_executor(executor, completion_cache.get, key)
+    current_span().set(cache="miss" if response is None else "hit")
+    if response is not None:
+        return response
+
+    response = await client.chat.completions.create(**request)
+    if calls_write_tool(response):
+        completion_cache.record("skipped_writes")
+    else:
+        await loop.run_in_executor(executor, completion_cache.put, key, response)
+    return response
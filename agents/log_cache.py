@@ -0,0 +1,176 @@
+import os
+import sqlite3
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from agents.splunk import get_splunk_client
+from agents.telemetry import metrics
+
+load_dotenv()
+
+# Persistent cache of NBP logs fetched from splunk, keyed by integration ID
+NBP_LOG_CACHE_ENABLED = os.getenv("NBP_LOG_CACHE_ENABLED", "true").lower() == "true"
+NBP_LOG_CACHE_PATH = os.getenv("NBP_LOG_CACHE_PATH", os.path.join(".cache", "nbp_log_cache.sqlite3"))
+NBP_LOG_CACHE_MAX_BYTES = int(os.getenv("NBP_LOG_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Seconds a "log not found" answer is trusted before splunk is asked again
+NBP_LOG_CACHE_NEGATIVE_TTL = float(os.getenv("NBP_LOG_CACHE_NEGATIVE_TTL", "600"))
+
+
+class NbpLogCache:
+    """
+    SQLite-backed cache of raw NBP logs.
+
+    A log never changes once written, so found logs are kept until the cache
+    exceeds `max_bytes`, then the least recently used ones are evicted.
+    Misses ("log not found") are cached too, but only for `negative_ttl`
+    seconds because the log may still be on its way to splunk.
+    """
+
+    def __init__(self, path=NBP_LOG_CACHE_PATH, max_bytes=NBP_LOG_CACHE_MAX_BYTES,
+                 negative_ttl=NBP_LOG_CACHE_NEGATIVE_TTL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._connection = None
+        self._stats = {"hits": 0, "negative_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _connect(self):
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS nbp_logs (
+                    integration_id TEXT PRIMARY KEY,
+                    raw_log TEXT,
+                    size INTEGER NOT NULL,
+                    expires_at REAL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS nbp_logs_last_access ON nbp_logs (last_access)")
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+    def get_many(self, integration_ids):
+        """Returns ({integration_id: raw log or None} for cached IDs, [IDs that must be fetched])."""
+        now = time.time()
+        found = {}
+        with self._lock:
+            connection = self._connect()
+            for integration_id in dict.fromkeys(integration_ids):
+                row = connection.execute(
+                    "SELECT raw_log, expires_at FROM nbp_logs WHERE integration_id = ?", (integration_id,)
+                ).fetchone()
+                if row is None or (row[1] is not None and row[1] <= now):
+                    continue
+                found[integration_id] = row[0]
+                self._stats["hits" if row[0] is not None else "negative_hits"] += 1
+            if found:
+                connection.executemany(
+                    "UPDATE nbp_logs SET last_access = ? WHERE integration_id = ?",
+                    [(now, integration_id) for integration_id in found],
+                )
+                connection.commit()
+            missing = [integration_id for integration_id in dict.fromkeys(integration_ids) if integration_id not in found]
+            self._stats["misses"] += len(missing)
+        return found, missing
+
+    def put_many(self, logs):
+        """Stores {integration_id: raw log or None}; None is cached as a short-lived miss."""
+        now = time.time()
+        rows = [
+            (
+                integration_id,
+                raw_log,
+                len(raw_log or ""),
+                None if raw_log is not None else now + self.negative_ttl,
+                now,
+            )
+            for integration_id, raw_log in logs.items()
+        ]
+        with self._lock:
+            connection = self._connect()
+            connection.executemany(
+                "INSERT OR REPLACE INTO nbp_logs (integration_id, raw_log, size, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._stats["stores"] += len(rows)
+            self._evict(connection)
+            connection.commit()
+
+    def _evict(self, connection):
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM nbp_logs").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        connection.execute("DELETE FROM nbp_logs WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+        for integration_id, size in connection.execute(
+            "SELECT integration_id, size FROM nbp_logs ORDER BY last_access"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            connection.execute("DELETE FROM nbp_logs WHERE integration_id = ?", (integration_id,))
+            total -= size
+            self._stats["evictions"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            entries, size = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM nbp_logs"
+            ).fetchone()
+        stats["entries"] = entries
+        stats["bytes"] = size
+        return stats
+
+    def clear(self):
+        with self._lock:
+            connection = self._connect()
+            connection.execute("DELETE FROM nbp_logs")
+            connection.commit()
+
+
+nbp_log_cache = NbpLogCache()
+metrics.register_collector("ufo_nbp_log_cache", nbp_log_cache.stats)
+
+
+def find_logs(integration_ids):
+    """
+    Returns {integration_id: raw NBP log or None}, consulting the cache first
+    and fetching only the misses from splunk in batched searches.
+
+    Only logs that were found are cached here. A batch search may be capped,
+    so an ID it did not return is not negative-cached; find_log searches for it
+    alone and caches the miss once that search confirms it.
+    """
+    if not NBP_LOG_CACHE_ENABLED:
+        return get_splunk_client().find_logs(integration_ids)
+
+    logs, missing = nbp_log_cache.get_many(integration_ids)
+    if missing:
+        fetched = get_splunk_client().find_logs(missing, confirm_missing=False)
+        nbp_log_cache.put_many(fetched)
+        logs.update({integration_id: fetched.get(integration_id) for integration_id in missing})
+    return logs
+
+
+def find_log(integration_id):
+    """Returns the raw NBP log of one integration ID, or None, consulting the cache first."""
+    if not NBP_LOG_CACHE_ENABLED:
+        return get_splunk_client().find_log(integration_id)
+
+    logs, missing = nbp_log_cache.get_many([integration_id])
+    if not missing:
+        return logs[integration_id]
+    raw_log = get_splunk_client().find_log(integration_id)
+    nbp_log_cache.put_many({integration_id: raw_log})
+    return raw_log
@@ -1,110 +1,228 @@
 import psycopg2
-from psycopg2 import OperationalError
-from openai import OpenAI
-from typing import Optional
-import httpx
-import inspect
-from mistralai import Mistral
-from pydantic import BaseModel
+from typing import Literal, Optional
 import json
-import time
-import requests
+import re
+import uuid
 from dotenv import load_dotenv
 import os
 from psycopg2.extras import RealDictCursor
-import httpx
+from agents.db import get_connection
+from agents.order_cache import order_continuations, order_resolution_cache
+from agents.context import as_message_dict
+from agents.core import Agent, seeded_tool_call
+from agents.turn import iter_turn, run_turn
+from agents.telemetry import metrics, span
 
 load_dotenv()
 
-MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
 MISTRAL_MODEL = os.getenv("MISTRAL_MODEL")
-MISTRAL_BASE_URL = os.getenv("MISTRAL_BASE_URL")
-
-# Database connection constants
-DB_HOST = os.getenv("DB_HOST")
-DB_DATABASE = os.getenv("DB_DATABASE")
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-DB_PORT = os.getenv("DB_PORT")
-
-class Agent(BaseModel):
-    name: str = "Agent"
-    model: str = MISTRAL_MODEL
-    instructions: str = "You are a helpful Agent"
-    tools: list = []
-
-class Response(BaseModel):
-    agent: Optional[Agent]
-    messages: list
-
-# Use this for local only, connect to Mistral Free API
-# client = Mistral(
-#    api_key = MISTRAL_API_KEY,
-# )
-
-# Use this for server
-client = OpenAI(
-    api_key = MISTRAL_API_KEY,
-    base_url = MISTRAL_BASE_URL,
-    http_client = httpx.Client(verify=False),
-)
 
-def query_order_resolution(id_type: str, id_list: list) -> list:
+# Large ID lists: IDs bound per query, rows per server-side cursor round trip, and the size of
+# one tool response, so a pasted ticket export never lands in the model's context in one piece
+ORDER_QUERY_CHUNK_SIZE = int(os.getenv("ORDER_QUERY_CHUNK_SIZE", "1000"))
+ORDER_QUERY_FETCH_SIZE = int(os.getenv("ORDER_QUERY_FETCH_SIZE", "500"))
+ORDER_QUERY_PAGE_CHARS = int(os.getenv("ORDER_QUERY_PAGE_CHARS", "12000"))
+
+# The whole ID list is bound as a single array parameter
+ORDER_RESOLUTION_QUERIES = {
+    "IH_NUMBER": "SELECT * FROM UFO_ORDER_RESOLUTION WHERE IH_NUMBER = ANY(%s)",
+    "CUSTOMER_ORDER_ID": "SELECT * FROM UFO_ORDER_RESOLUTION WHERE CUSTOMER_ORDER_ID = ANY(%s)",
+}
+
+def _fetch_order_resolutions(id_type, ids):
+    """
+    Returns {id: rows} for one chunk of ids, with an empty list for IDs without a resolution.
+
+    Rows are streamed through a named (server-side) cursor, ORDER_QUERY_FETCH_SIZE
+    at a time, so the client never buffers more than one chunk's rows.
+    """
+    fetched = {id: [] for id in ids}
+    try:
+        # Borrow a connection from the shared pool
+        with get_connection() as connection:
+            with connection.cursor(name=f"order_resolution_{uuid.uuid4().hex}", cursor_factory=RealDictCursor) as cursor, \
+                    span("db", "query_order_resolution", id_type=id_type, ids=len(ids)) as db_span:
+                cursor.itersize = ORDER_QUERY_FETCH_SIZE
+                cursor.execute(ORDER_RESOLUTION_QUERIES[id_type], (list(ids),))
+                rows = 0
+                for row in cursor:
+                    fetched.setdefault(str(row[id_type.lower()]), []).append(row)
+                    rows += 1
+                db_span.set(rows=rows)
+
+    except psycopg2.Error as e:
+        # Handle database errors
+        raise psycopg2.Error(f"Database error occurred: {e}")
+
+    return fetched
+
+def _lookup_order_resolutions(id_type, ids):
+    """Returns {id: rows} for ids, serving recently looked-up IDs from the shared cache."""
+    cached, missing_ids, generation = order_resolution_cache.get_many(id_type, ids)
+    if missing_ids:
+        fetched = _fetch_order_resolutions(id_type, missing_ids)
+        order_resolution_cache.put_many(id_type, fetched, generation)
+        cached.update(fetched)
+    return cached
+
+def query_order_resolution(id_type: Literal["IH_NUMBER", "CUSTOMER_ORDER_ID"], id_list: Optional[list[str]] = None,
+                           continuation_token: Optional[str] = None) -> list:
     """
     Queries the UFO_ORDER_RESOLUTION table for order resolution details based on id_type and id_list.
+    Large results are paginated: if the response contains a continuation_token, call again with the same id_type and only that continuation_token to get the next page.
+    """
+    if continuation_token:
+        pending = order_continuations.take(continuation_token)
+        if pending is None:
+            return "Error: continuation_token is unknown or expired, query the remaining id_list again"
+        id_type, ids = pending
+    else:
+        # Validate inputs
+        if not id_list:
+            raise ValueError("id_list cannot be empty")
+
+        valid_id_types = ["IH_NUMBER", "CUSTOMER_ORDER_ID"]
+        # The cache keys and the queries use the upper-case id_type
+        id_type = id_type.upper()
+        if id_type not in valid_id_types:
+            raise ValueError(f"id_type must be one of {valid_id_types}, got {id_type}")
+        ids = list(dict.fromkeys(id_list))
+
+    # Fill the page ID by ID, in the order given, until the next ID's rows would overflow it;
+    # chunks after the page is full are never queried
+    page = []
+    page_chars = 0
+    returned = 0
+    remaining = []
+    for start in range(0, len(ids), ORDER_QUERY_CHUNK_SIZE):
+        chunk = ids[start:start + ORDER_QUERY_CHUNK_SIZE]
+        rows_by_id = _lookup_order_resolutions(id_type, chunk)
+        for offset, id in enumerate(chunk):
+            encoded = [json.dumps(row, default=str) for row in rows_by_id.get(id, [])]
+            chars = sum(len(row) + 2 for row in encoded)
+            if returned and page_chars + chars > ORDER_QUERY_PAGE_CHARS:
+                remaining = ids[start + offset:]
+                break
+            page.extend(encoded)
+            page_chars += chars
+            returned += 1
+        if remaining:
+            break
+
+    # Convert to JSON string
+    results = "[" + ", ".join(page) + "]"
+    if not remaining:
+        return results
+
+    token = order_continuations.put(id_type, remaining)
+    return (
+        f'{{"results": {results}, "ids_returned": {returned}, "ids_remaining": {len(remaining)}, '
+        f'"continuation_token": {json.dumps(token)}}}'
+    )
+
+# Resolution summaries: example IDs kept per group and groups returned to the model
+SUMMARY_MAX_EXAMPLES = int(os.getenv("SUMMARY_MAX_EXAMPLES", "3"))
+SUMMARY_MAX_GROUPS = int(os.getenv("SUMMARY_MAX_GROUPS", "50"))
+
+SUMMARY_GROUP_EXPRESSIONS = {
+    "system": "system",
+    "root_cause_analysis": "root_cause_analysis",
+    "action": (
+        "CASE WHEN action_taken LIKE 'RETRY:%%' THEN 'RETRY' "
+        "WHEN action_taken LIKE 'INFORM:%%' THEN 'INFORM' "
+        "WHEN action_taken LIKE 'FORCE:%%' THEN 'FORCE' ELSE 'OTHER' END"
+    ),
+    "submitted_date": "date_trunc('{date_bucket}', submitted_date)",
+}
+
+def _summary_query(id_type, group_by, date_bucket):
+    id_column = id_type.lower()
+    columns = [
+        SUMMARY_GROUP_EXPRESSIONS[group].format(date_bucket=date_bucket) + f" AS {group}" for group in group_by
+    ]
+    columns.append("COUNT(*) AS orders")
+    columns.append(f"(array_agg({id_column} ORDER BY {id_column}))[1:%s] AS example_ids")
+    query = f"SELECT {', '.join(columns)} FROM UFO_ORDER_RESOLUTION WHERE {id_column} = ANY(%s)"
+    if group_by:
+        query += " GROUP BY " + ", ".join(str(position) for position in range(1, len(group_by) + 1))
+    return query
+
+def summarize_order_resolution(id_type: Literal["IH_NUMBER", "CUSTOMER_ORDER_ID"], id_list: list[str],
+                               group_by: Optional[list[Literal["system", "root_cause_analysis", "action", "submitted_date"]]] = None,
+                               date_bucket: Literal["day", "week", "month"] = "day") -> dict:
+    """
+    Summarizes the order resolutions of many orders at once: the number of orders per system, root_cause_analysis, action (RETRY, INFORM, FORCE or OTHER) and submitted_date bucket, with a few example IDs per group.
+    Use it instead of query_order_resolution for questions about totals, breakdowns or long lists of orders. group_by defaults to all four dimensions.
     """
     # Validate inputs
     if not id_list:
         raise ValueError("id_list cannot be empty")
-    
+
     valid_id_types = ["IH_NUMBER", "CUSTOMER_ORDER_ID"]
-    if id_type.upper() not in valid_id_types:
+    id_type = id_type.upper()
+    if id_type not in valid_id_types:
         raise ValueError(f"id_type must be one of {valid_id_types}, got {id_type}")
+    if date_bucket not in ("day", "week", "month"):
+        raise ValueError(f"date_bucket must be one of day, week, month, got {date_bucket}")
+    group_by = list(dict.fromkeys(group_by if group_by is not None else SUMMARY_GROUP_EXPRESSIONS))
+    ids = list(dict.fromkeys(id_list))
 
-    # Format the id_list for SQL IN clause, treating all IDs as strings
-    formatted_ids = ", ".join(f"'{id}'" for id in id_list)
-    if id_type == "IH_NUMBER":
-        query = f"SELECT * FROM UFO_ORDER_RESOLUTION WHERE IH_NUMBER IN ({formatted_ids})"
-    else:  # id_type == "CUSTOMER_ORDER_ID"
-        query = f"SELECT * FROM UFO_ORDER_RESOLUTION WHERE CUSTOMER_ORDER_ID IN ({formatted_ids})"
+    query = _summary_query(id_type, group_by, date_bucket)
+    id_column = id_type.lower()
 
-    # Database connection and execution
+    # Counting happens in the database; chunks of a very large list are merged group by group
+    groups = {}
+    found = 0
     try:
-        # Establish connection
-        connection = None
-        connection = psycopg2.connect(
-            host=DB_HOST,
-            database=DB_DATABASE,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            port=DB_PORT,
-            cursor_factory=RealDictCursor
-        )
-        
-        # Create cursor and execute query
-        cursor = connection.cursor()
-        cursor.execute(query)
-        
-        # Fetch all results
-        results = cursor.fetchall()
-        
-        # Convert to JSON string
-        json_results = json.dumps(results, default=str)
-        
-        # Close connection
-        cursor.close()
-        connection.close()
-        
-        return json_results
+        # Borrow a connection from the shared pool
+        with get_connection() as connection:
+            with connection.cursor(cursor_factory=RealDictCursor) as cursor, \
+                    span("db", "summarize_order_resolution", id_type=id_type, ids=len(ids)) as db_span:
+                for start in range(0, len(ids), ORDER_QUERY_CHUNK_SIZE):
+                    chunk = ids[start:start + ORDER_QUERY_CHUNK_SIZE]
+                    cursor.execute(query, (SUMMARY_MAX_EXAMPLES, chunk))
+                    for row in cursor.fetchall():
+                        if not row["orders"]:
+                            continue
+                        key = tuple(row[group] for group in group_by)
+                        group = groups.setdefault(key, {"orders": 0, "example_ids": []})
+                        group["orders"] += row["orders"]
+                        group["example_ids"] = sorted(group["example_ids"] + list(row["example_ids"]))[:SUMMARY_MAX_EXAMPLES]
+
+                    cursor.execute(
+                        f"SELECT COUNT(DISTINCT {id_column}) AS found FROM UFO_ORDER_RESOLUTION WHERE {id_column} = ANY(%s)",
+                        (chunk,),
+                    )
+                    found += cursor.fetchone()["found"]
+                db_span.set(groups=len(groups))
 
     except psycopg2.Error as e:
         # Handle database errors
         raise psycopg2.Error(f"Database error occurred: {e}")
 
-def retry_order(customer_order_id):
+    summary = [
+        {**dict(zip(group_by, key)), **group}
+        for key, group in sorted(groups.items(), key=lambda item: item[1]["orders"], reverse=True)
+    ]
+    for group in summary:
+        if group.get("submitted_date") is not None:
+            group["submitted_date"] = str(group["submitted_date"])[:10]
+
+    # Convert to JSON string
+    return json.dumps(
+        {
+            "ids_requested": len(ids),
+            "ids_without_resolution": len(ids) - found,
+            "groups": summary[:SUMMARY_MAX_GROUPS],
+            "groups_omitted": max(len(summary) - SUMMARY_MAX_GROUPS, 0),
+        },
+        default=str,
+    )
+
+def retry_order(customer_order_id: str):
     return "Retry order is executed successfully."
 
-def force_complete_order(customer_order_id):
+def force_complete_order(customer_order_id: str):
     return "This order has been force completed."
 
 
@@ -121,133 +239,83 @@ manager_agent = Agent(
             - IH_NUMBER: format is number only e.g., 190000000080, 190000000004, 190000000002
             - CUSTOMER_ORDER_ID: format is mixed of letters and numbers in the following pattern e.g., MOk42501300904219745e55a0, MOi12501190613532282c4b90, MOi125012009210093641d5b0).
         2. Query order resolution table to find the associated root cause and resolution using the id_type (either IH_NUMBER or CUSTOMER_ORDER_ID) and id_list which is a list of the order IDs.
+            - Pass every ID in one call, however long the list is. Large results come back a page at a time with a continuation_token; fetch the next page with that token only when you need the remaining orders.
+            - If the user asks for totals or a breakdown (e.g. how many orders per root cause, system, action or day), or gives more orders than you can list one by one, use the summarize order resolution tool instead and report its counts and example IDs.
         3. If the action taken contains "INFORM:", you can offer to the user some help to write the draft email in bahasa Indonesia. Do not offer to send the email because you are not authorized to do so.
         4. If the action taken contains "RETRY:", ask the user for approval if he wants to execute the retry order. If the user approves, execute the retry ufo order tool.
         5. If the action taken contains "FORCE:", ask the user for approval if he wants to force complete. If the user approves, execute the force complete order tool.
     """,
-    tools=[query_order_resolution, retry_order, force_complete_order],
+    tools=[query_order_resolution, summarize_order_resolution, retry_order, force_complete_order],
     tool_choice = "any",
 )
 
 
-def function_to_schema(func) -> dict:
-    type_map = {
-        str: "string",
-        int: "integer",
-        float: "number",
-        bool: "boolean",
-        list: "array",
-        dict: "object",
-        type(None): "null",
-    }
+# Pre-routing: a message that just asks about order IDs is looked up before the first model call,
+# so the model is only called to phrase the answer with the results already in context
+MANAGER_PREROUTE = os.getenv("MANAGER_PREROUTE", "true").lower() == "true"
+# Longer ID lists are left to the model, which may prefer the summary tool
+MANAGER_PREROUTE_MAX_IDS = int(os.getenv("MANAGER_PREROUTE_MAX_IDS", "50"))
 
-    try:
-        signature = inspect.signature(func)
-    except ValueError as e:
-        raise ValueError(
-            f"Failed to get signature for function {func.__name__}: {str(e)}"
-        )
-
-    parameters = {}
-    for param in signature.parameters.values():
-        try:
-            param_type = type_map.get(param.annotation, "string")
-        except KeyError as e:
-            raise KeyError(
-                f"Unknown type annotation {param.annotation} for parameter {param.name}: {str(e)}"
-            )
-        parameters[param.name] = {"type": param_type}
-
-    required = [
-        param.name
-        for param in signature.parameters.values()
-        if param.default == inspect._empty
-    ]
+_IH_NUMBER_PATTERN = re.compile(r"(?<![\w-])\d{9,15}(?![\w-])")
+_CUSTOMER_ORDER_ID_PATTERN = re.compile(r"(?<![\w-])(?:MO|AO)(?=[A-Za-z]*\d)[A-Za-z0-9]{10,}(?![\w-])")
+# Messages the model has to handle itself: order actions, approvals, emails and aggregate questions
+_MODEL_ONLY_PATTERN = re.compile(
+    r"\b(retry|force|complete|approve|yes|email|draft|summar\w*|how many|count|total)\b", re.IGNORECASE
+)
 
-    return {
-        "type": "function",
-        "function": {
-            "name": func.__name__,
-            "description": (func.__doc__ or "").strip(),
-            "parameters": {
-                "type": "object",
-                "properties": parameters,
-                "required": required,
-            },
-        },
-    }
+def preroute(agent, messages):
+    """
+    Classifies the order IDs in the latest user message for a direct resolution lookup.
 
-def execute_tool_call(tool_call, tools, agent_name):
-    name = tool_call.function.name
-    args = json.loads(tool_call.function.arguments)
+    Returns (id_type, id_list) when the message asks about orders of a single ID type, or None
+    to leave it to the model: no IDs, mixed ID types, long lists, order actions and approvals.
+    """
+    if not MANAGER_PREROUTE or not messages or "query_order_resolution" not in agent.registry:
+        return None
+    message = as_message_dict(messages[-1])
+    content = message.get("content")
+    if message.get("role") != "user" or not isinstance(content, str) or _MODEL_ONLY_PATTERN.search(content):
+        return None
+
+    ih_numbers = _IH_NUMBER_PATTERN.findall(content)
+    customer_order_ids = _CUSTOMER_ORDER_ID_PATTERN.findall(content)
+    if bool(ih_numbers) == bool(customer_order_ids):
+        return None
+    id_type, id_list = ("IH_NUMBER", ih_numbers) if ih_numbers else ("CUSTOMER_ORDER_ID", customer_order_ids)
+    id_list = list(dict.fromkeys(id_list))
+    if len(id_list) > MANAGER_PREROUTE_MAX_IDS:
+        return None
+    return id_type, id_list
+
+def prerouted_lookup(agent, messages):
+    """
+    The manager agent's prelude: runs the query_order_resolution call of a plain order lookup
+    before the first model call. Returns the tool call and tool result messages to append.
+    """
+    route = preroute(agent, messages)
+    if route is None:
+        return []
+    id_type, id_list = route
+    metrics.inc("ufo_manager_preroutes_total", 1, "Manager lookups run before the first model call.", id_type=id_type)
+    return seeded_tool_call(
+        agent, "query_order_resolution", {"id_type": id_type, "id_list": id_list}, prerouted=True
+    )
 
-    print(f"{agent_name}:", "Executing tool:", f"{name}({args})")
+manager_agent.prelude = prerouted_lookup
 
-    return tools[name](**args)
 
 def run_full_turn(agent, messages):
+    return run_turn(agent, messages)
 
-    current_agent = agent
-    num_init_messages = len(messages)
-    messages = messages.copy()
-    i = 0
-    while True:
-        i+=1
-        print("Iter: " + str(i))
-
-        # turn python functions into tools and save a reverse map
-        tool_schemas = [function_to_schema(tool) for tool in current_agent.tools]
-        tools = {tool.__name__: tool for tool in current_agent.tools}
-
-        print("Current agent: " + current_agent.name)
-        #print(messages)
-
-        # Use this for local only, connect to Mistral Free API
-        # time.sleep(2)
-        # response = client.chat.complete(
-        #     model=MISTRAL_MODEL,
-        #     messages=[{"role": "system", "content": current_agent.instructions}]
-        #     + messages,
-        #     temperature=0.0,
-        #     tools = tool_schemas,
-        #     tool_choice = "auto",
-        # )
-
-        # Use this for server, using OpenAI API
-        response = client.chat.completions.create(
-            model=MISTRAL_MODEL,
-            messages=[{"role": "system", "content": current_agent.instructions}]
-            + messages,
-            temperature=0.0,
-            tools = tool_schemas,
-            tool_choice = "auto",
-        )
-        
-        message = response.choices[0].message
-        messages.append(message)
-
-        if message.content:  # print agent response
-            print(f"{current_agent.name}:", message.content)
-
-        if not message.tool_calls:  # if finished handling tool calls, break
-            break
-
-        for tool_call in message.tool_calls:
-            result = execute_tool_call(tool_call, tools, current_agent.name)
-            print("Tool call completed. Result:")
-            if type(result) is Agent:  # if agent transfer, update current agent
-                current_agent = result
-                result = (
-                    f"Transfered to {current_agent.name}. Adopt persona immediately."
-                )
-
-            result_message = {
-                "role": "tool",
-                "tool_call_id": tool_call.id,
-                "name": tool_call.function.name,
-                "content": result,
-            }
-            print(result_message)
-            messages.append(result_message)
-
-    return Response(agent=current_agent, messages=messages[num_init_messages:])
+def run_full_turn_stream(agent, messages):
+    """
+    Streaming variant of run_full_turn.
+
+    Yields events as they arrive instead of returning once the turn is complete:
+        {"type": "delta", "content": str}             content fragment of the current assistant message
+        {"type": "message", "message": message}       assistant message completed
+        {"type": "tool_call", "name": str, "arguments": str}    raw JSON arguments
+        {"type": "tool_result", "name": str, "content": str}
+        {"type": "done", "response": Response}        turn finished
+    """
+    yield from iter_turn(agent, messages, stream=True)
@@ -0,0 +1,202 @@
+# Versioned schema migrations for the UFO tables.
+#
+# The base tables are created from ddl_ufo_resolution_table.txt and
+# ddl_ufo_sop_table.txt; the migrations below add the keys and indexes the agent
+# tools rely on. Apply them with:
+#
+#     python -m agents.migrations            # apply pending migrations
+#     python -m agents.migrations --verify   # apply, then EXPLAIN the hot queries
+import argparse
+import json
+import os
+
+from dotenv import load_dotenv
+
+from agents.db import get_connection
+
+load_dotenv()
+
+# Apply pending migrations when the Streamlit app starts
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "false").lower() == "true"
+
+# Arbitrary key for the advisory lock that serializes concurrent migration runs
+MIGRATION_LOCK_ID = 74210501
+
+MIGRATIONS = [
+    (
+        1,
+        "Add primary keys and lookup indexes",
+        [
+            "ALTER TABLE ufo_order_resolution ADD COLUMN IF NOT EXISTS resolution_id BIGSERIAL",
+            "ALTER TABLE ufo_order_resolution ADD CONSTRAINT ufo_order_resolution_pkey PRIMARY KEY (resolution_id)",
+            "ALTER TABLE ufo_sop ADD CONSTRAINT ufo_sop_pkey PRIMARY KEY (id)",
+            "CREATE INDEX IF NOT EXISTS ufo_order_resolution_ih_number_idx ON ufo_order_resolution (ih_number)",
+            "CREATE INDEX IF NOT EXISTS ufo_order_resolution_customer_order_id_idx ON ufo_order_resolution (customer_order_id)",
+            "CREATE INDEX IF NOT EXISTS ufo_order_resolution_integration_id_idx ON ufo_order_resolution (integration_id)",
+            "CREATE INDEX IF NOT EXISTS ufo_order_resolution_submitted_date_idx ON ufo_order_resolution (submitted_date)",
+            "CREATE INDEX IF NOT EXISTS ufo_sop_error_code_idx ON ufo_sop (error_code)",
+        ],
+    ),
+    (
+        2,
+        "Make resolution inserts idempotent per integration and transaction",
+        [
+            # Keep the most recent resolution of any duplicates before adding the constraint: the latest
+            # action_timestamp, the highest resolution_id only between rows with the same timestamp
+            """
+            DELETE FROM ufo_order_resolution
+            WHERE resolution_id IN (
+                SELECT resolution_id
+                FROM (
+                    SELECT resolution_id,
+                           ROW_NUMBER() OVER (
+                               PARTITION BY integration_id, transaction_id
+                               ORDER BY action_timestamp DESC NULLS LAST, resolution_id DESC
+                           ) AS position
+                    FROM ufo_order_resolution
+                    WHERE integration_id IS NOT NULL AND transaction_id IS NOT NULL
+                ) ranked
+                WHERE position > 1
+            )
+            """,
+            """
+            ALTER TABLE ufo_order_resolution
+            ADD CONSTRAINT ufo_order_resolution_integration_transaction_key UNIQUE (integration_id, transaction_id)
+            """,
+        ],
+    ),
+]
+
+# Version that introduces the (integration_id, transaction_id) unique constraint
+IDEMPOTENT_INSERT_VERSION = 2
+
+# Hot queries whose plans must use an index once the migrations are applied
+HOT_QUERIES = {
+    "resolution by IH_NUMBER": (
+        "SELECT * FROM ufo_order_resolution WHERE ih_number = ANY(%s)",
+        (["190000000080", "190000000004"],),
+    ),
+    "resolution by CUSTOMER_ORDER_ID": (
+        "SELECT * FROM ufo_order_resolution WHERE customer_order_id = ANY(%s)",
+        (["MOk42501300904219745e55a0", "MOi12501190613532282c4b90"],),
+    ),
+    "resolution by INTEGRATION_ID": (
+        "SELECT * FROM ufo_order_resolution WHERE integration_id = %s",
+        ("R0HUEMVC1IY0ZUM7XMS0ALMAP",),
+    ),
+    "resolution by SUBMITTED_DATE range": (
+        "SELECT * FROM ufo_order_resolution WHERE submitted_date >= %s AND submitted_date < %s",
+        ("2025-01-01", "2025-02-01"),
+    ),
+    "sop by ERROR_CODE": (
+        "SELECT * FROM ufo_sop WHERE error_code = %s",
+        ("CM-CPfailed",),
+    ),
+}
+
+
+def _ensure_version_table(cursor):
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now()
+        )
+        """
+    )
+
+
+def current_version():
+    """Returns the highest applied migration version, 0 if none."""
+    with get_connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('schema_migrations')")
+            if cursor.fetchone()[0] is None:
+                return 0
+            cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+            return cursor.fetchone()[0]
+
+
+def apply_migrations():
+    """
+    Applies every pending migration, each in its own transaction.
+
+    Concurrent callers (several app replicas starting at once) are serialized
+    with an advisory lock. Returns the list of versions applied.
+    """
+    applied = []
+    for version, description, statements in MIGRATIONS:
+        with get_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+                _ensure_version_table(cursor)
+                cursor.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (version,))
+                if cursor.fetchone() is not None:
+                    connection.rollback()
+                    continue
+
+                print(f"Applying migration {version}: {description}")
+                for statement in statements:
+                    cursor.execute(statement)
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                    (version, description),
+                )
+            connection.commit()
+        applied.append(version)
+    return applied
+
+
+def _plan_nodes(plan):
+    nodes = [plan["Node Type"]]
+    for child in plan.get("Plans", []):
+        nodes.extend(_plan_nodes(child))
+    return nodes
+
+
+def verify_index_usage():
+    """
+    EXPLAINs every hot query and reports whether its plan uses an index.
+
+    Sequential scans are disabled for the check, so a small table that the
+    planner would rather scan still proves that a usable index exists.
+    Returns {query name: {"uses_index": bool, "nodes": [plan node types]}}.
+    """
+    report = {}
+    with get_connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            for name, (query, params) in HOT_QUERIES.items():
+                cursor.execute("EXPLAIN (FORMAT JSON) " + query, params)
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                nodes = _plan_nodes(plan[0]["Plan"])
+                report[name] = {
+                    "uses_index": any("Index" in node for node in nodes),
+                    "nodes": nodes,
+                }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply the UFO schema migrations.")
+    parser.add_argument("--verify", action="store_true", help="EXPLAIN the hot queries after migrating")
+    args = parser.parse_args()
+
+    applied = apply_migrations()
+    print(f"Applied migrations: {applied or 'none'}; schema version {current_version()}")
+
+    if args.verify:
+        failed = False
+        for name, result in verify_index_usage().items():
+            status = "OK" if result["uses_index"] else "SEQUENTIAL SCAN"
+            failed = failed or not result["uses_index"]
+            print(f"{status:16} {name}: {' > '.join(result['nodes'])}")
+        if failed:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
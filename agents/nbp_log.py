@@ -0,0 +1,77 @@
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+NBP_LOG_SEPARATOR = "|"
+
+# Named fields of an NBP log line and their 1-based position among the '|' separated fields.
+# Extend with NBP_LOG_FIELD_POSITIONS, e.g. "error_message:36,response_time:12".
+NBP_LOG_FIELDS = {
+    "error_code": 35,
+}
+
+
+def _configured_fields():
+    fields = dict(NBP_LOG_FIELDS)
+    for item in os.getenv("NBP_LOG_FIELD_POSITIONS", "").split(","):
+        if not item.strip():
+            continue
+        name, _, position = item.partition(":")
+        fields[name.strip()] = int(position)
+    return fields
+
+
+FIELD_POSITIONS = _configured_fields()
+
+
+def extract_fields(raw_log, positions=None):
+    """
+    Returns {name: value} for the requested fields of a raw NBP log line.
+
+    Scans the line once with str.find and slices out only the requested
+    fields, instead of splitting the whole line into a list. A field beyond
+    the end of the line is returned as None, an empty field as "".
+    """
+    positions = FIELD_POSITIONS if positions is None else positions
+    wanted = sorted((position, name) for name, position in positions.items())
+    values = {name: None for name in positions}
+
+    start = 0
+    position = 1
+    length = len(raw_log)
+    for target, name in wanted:
+        while position < target:
+            separator = raw_log.find(NBP_LOG_SEPARATOR, start)
+            if separator == -1:
+                return values
+            start = separator + 1
+            position += 1
+        end = raw_log.find(NBP_LOG_SEPARATOR, start)
+        values[name] = raw_log[start:length if end == -1 else end].strip()
+    return values
+
+
+def field_at(raw_log, position):
+    """Returns the field at a 1-based position of a raw NBP log line, or None if the line is shorter."""
+    return extract_fields(raw_log, {"field": position})["field"]
+
+
+def error_code(raw_log):
+    """Returns the NBP error code of a raw log line, or None if it is missing."""
+    return field_at(raw_log, FIELD_POSITIONS["error_code"]) or None
+
+
+def field_values(raw_log):
+    """Returns the set of stripped '|' separated field values of a raw NBP log line."""
+    return {field.strip() for field in raw_log.split(NBP_LOG_SEPARATOR)}
+
+
+def parse_nbp_log(raw_log, integration_id=None, include_raw_log=False):
+    """Builds the compact record returned to the agent: the named fields and, on request, the raw line."""
+    record = {"integration_id": integration_id, "found": True}
+    record.update(extract_fields(raw_log))
+    if include_raw_log:
+        record["raw_log"] = raw_log
+    return record
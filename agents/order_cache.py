@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+from agents.telemetry import metrics
+
+load_dotenv()
+
+# Per-ID cache of UFO_ORDER_RESOLUTION lookups, shared by every session in the process
+ORDER_CACHE_MAX_ENTRIES = int(os.getenv("ORDER_CACHE_MAX_ENTRIES", "10000"))
+ORDER_CACHE_TTL = float(os.getenv("ORDER_CACHE_TTL", "300"))
+# Pending pages of large ID-list lookups, resumed by continuation token
+ORDER_CONTINUATION_MAX_ENTRIES = int(os.getenv("ORDER_CONTINUATION_MAX_ENTRIES", "1000"))
+ORDER_CONTINUATION_TTL = float(os.getenv("ORDER_CONTINUATION_TTL", "1800"))
+
+
+class OrderResolutionCache:
+    """
+    Bounded, TTL-based LRU cache of resolution rows keyed by (id_type, id).
+
+    IDs without any resolution are cached as an empty list. Writers call
+    invalidate() for the IDs they touched; a read that started before an
+    invalidation does not repopulate the cache with rows it fetched.
+    """
+
+    def __init__(self, max_entries=ORDER_CACHE_MAX_ENTRIES, ttl=ORDER_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0, "evictions": 0}
+
+    def get_many(self, id_type, ids):
+        """Returns (rows by cached id, list of missing ids, generation to pass to put_many)."""
+        now = time.monotonic()
+        found = {}
+        missing = []
+        with self._lock:
+            for id in ids:
+                key = (id_type, id)
+                entry = self._entries.get(key)
+                if entry is not None and now - entry[0] < self.ttl:
+                    self._entries.move_to_end(key)
+                    found[id] = entry[1]
+                else:
+                    if entry is not None:
+                        del self._entries[key]
+                    missing.append(id)
+            self._stats["hits"] += len(found)
+            self._stats["misses"] += len(missing)
+            return found, missing, self._generation
+
+    def put_many(self, id_type, rows_by_id, generation):
+        now = time.monotonic()
+        with self._lock:
+            if generation != self._generation:
+                return
+            for id, rows in rows_by_id.items():
+                key = (id_type, id)
+                self._entries[key] = (now, rows)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def invalidate(self, ih_number=None, customer_order_id=None):
+        with self._lock:
+            self._generation += 1
+            self._stats["invalidations"] += 1
+            if ih_number is not None:
+                self._entries.pop(("IH_NUMBER", str(ih_number)), None)
+            if customer_order_id is not None:
+                self._entries.pop(("CUSTOMER_ORDER_ID", str(customer_order_id)), None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        return stats
+
+
+class ContinuationStore:
+    """
+    Bounded, TTL-based store of the IDs a paginated lookup has not returned yet.
+
+    The model only echoes back a short opaque token instead of the remaining
+    IDs, which may number in the thousands. A token is single-use: taking it
+    removes the entry, and the next page gets a fresh token.
+    """
+
+    def __init__(self, max_entries=ORDER_CONTINUATION_MAX_ENTRIES, ttl=ORDER_CONTINUATION_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"issued": 0, "resumed": 0, "expired": 0, "evictions": 0}
+
+    def put(self, id_type, ids):
+        """Stores the remaining ids and returns their continuation token."""
+        token = uuid.uuid4().hex
+        with self._lock:
+            self._entries[token] = (time.monotonic(), id_type, list(ids))
+            self._stats["issued"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+        return token
+
+    def take(self, token):
+        """Returns (id_type, remaining ids) for a token, or None if it is unknown or expired."""
+        with self._lock:
+            entry = self._entries.pop(token, None)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] >= self.ttl:
+                self._stats["expired"] += 1
+                return None
+            self._stats["resumed"] += 1
+            return entry[1], entry[2]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        return stats
+
+
+order_resolution_cache = OrderResolutionCache()
+metrics.register_collector("ufo_order_cache", order_resolution_cache.stats)
+
+order_continuations = ContinuationStore()
+metrics.register_collector("ufo_order_continuations", order_continuations.stats)
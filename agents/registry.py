@@ -0,0 +1,227 @@
+import enum
+import inspect
+import json
+import types
+import typing
+from typing import Literal, Union
+
+
+class ToolArgumentError(ValueError):
+    """Raised when the model calls a tool with missing, unknown or mistyped arguments."""
+
+
+_JSON_TYPES = {
+    str: "string",
+    int: "integer",
+    float: "number",
+    bool: "boolean",
+    list: "array",
+    dict: "object",
+    type(None): "null",
+}
+
+
+def _compile_annotation(annotation, name):
+    """
+    Returns (json_schema, validator) for a parameter annotation.
+
+    The validator takes the decoded JSON value and returns the value passed to
+    the tool, raising ToolArgumentError when it does not match.
+    """
+    if annotation is inspect.Parameter.empty:
+        return {"type": "string"}, lambda value: value
+
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+
+    if origin in (Union, types.UnionType):
+        allows_none = type(None) in args
+        members = [arg for arg in args if arg is not type(None)]
+        if len(members) != 1:
+            raise TypeError(f"Unsupported union annotation {annotation} for parameter {name}")
+        schema, validate_member = _compile_annotation(members[0], name)
+
+        def validate_optional(value):
+            if value is None and allows_none:
+                return None
+            return validate_member(value)
+
+        return schema, validate_optional
+
+    if origin is Literal:
+        choices = list(args)
+        by_folded = {str(choice).casefold(): choice for choice in choices}
+        schema = {"type": _JSON_TYPES.get(type(choices[0]), "string"), "enum": choices}
+
+        def validate_literal(value):
+            if value in choices:
+                return value
+            if isinstance(value, str) and value.casefold() in by_folded:
+                return by_folded[value.casefold()]
+            raise ToolArgumentError(f"{name} must be one of {choices}, got {value!r}")
+
+        return schema, validate_literal
+
+    if inspect.isclass(annotation) and issubclass(annotation, enum.Enum):
+        members = list(annotation)
+        choices = [member.value for member in members]
+        schema = {"type": _JSON_TYPES.get(type(choices[0]), "string"), "enum": choices}
+
+        def validate_enum(value):
+            for member in members:
+                if value == member.value or (isinstance(value, str) and value.casefold() == str(member.value).casefold()):
+                    return member
+            raise ToolArgumentError(f"{name} must be one of {choices}, got {value!r}")
+
+        return schema, validate_enum
+
+    if origin is list or annotation is list:
+        if args:
+            item_schema, validate_item = _compile_annotation(args[0], f"{name}[]")
+        else:
+            item_schema, validate_item = None, lambda value: value
+        schema = {"type": "array"}
+        if item_schema is not None:
+            schema["items"] = item_schema
+
+        def validate_list(value):
+            if not isinstance(value, list):
+                raise ToolArgumentError(f"{name} must be an array, got {type(value).__name__}")
+            return [validate_item(item) for item in value]
+
+        return schema, validate_list
+
+    if origin is dict or annotation is dict:
+        def validate_dict(value):
+            if not isinstance(value, dict):
+                raise ToolArgumentError(f"{name} must be an object, got {type(value).__name__}")
+            return value
+
+        return {"type": "object"}, validate_dict
+
+    if annotation is str:
+        def validate_str(value):
+            # Models often emit numeric IDs such as IH numbers without quotes
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return str(value)
+            if not isinstance(value, str):
+                raise ToolArgumentError(f"{name} must be a string, got {type(value).__name__}")
+            return value
+
+        return {"type": "string"}, validate_str
+
+    if annotation is bool:
+        def validate_bool(value):
+            if not isinstance(value, bool):
+                raise ToolArgumentError(f"{name} must be a boolean, got {type(value).__name__}")
+            return value
+
+        return {"type": "boolean"}, validate_bool
+
+    if annotation is int:
+        def validate_int(value):
+            if isinstance(value, str) and value.strip().lstrip("-").isdigit():
+                return int(value)
+            if isinstance(value, bool) or not isinstance(value, int):
+                raise ToolArgumentError(f"{name} must be an integer, got {type(value).__name__}")
+            return value
+
+        return {"type": "integer"}, validate_int
+
+    if annotation is float:
+        def validate_float(value):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ToolArgumentError(f"{name} must be a number, got {type(value).__name__}")
+            return float(value)
+
+        return {"type": "number"}, validate_float
+
+    return {"type": _JSON_TYPES.get(annotation, "string")}, lambda value: value
+
+
+class CompiledTool:
+    """A tool function with its JSON schema and argument validator built once."""
+
+    def __init__(self, func):
+        try:
+            signature = inspect.signature(func)
+            hints = typing.get_type_hints(func)
+        except (ValueError, TypeError, NameError) as e:
+            raise ValueError(
+                f"Failed to get signature for function {func.__name__}: {str(e)}"
+            )
+
+        self.func = func
+        self.name = func.__name__
+        self.is_async = inspect.iscoroutinefunction(func)
+
+        properties = {}
+        self._validators = {}
+        self._required = []
+        for param in signature.parameters.values():
+            annotation = hints.get(param.name, param.annotation)
+            schema, validator = _compile_annotation(annotation, param.name)
+            properties[param.name] = schema
+            self._validators[param.name] = validator
+            if param.default is inspect.Parameter.empty:
+                self._required.append(param.name)
+
+        self.schema = {
+            "type": "function",
+            "function": {
+                "name": self.name,
+                "description": (func.__doc__ or "").strip(),
+                "parameters": {
+                    "type": "object",
+                    "properties": properties,
+                    "required": list(self._required),
+                },
+            },
+        }
+
+    def parse_arguments(self, raw_arguments):
+        """Decodes and validates the model's JSON arguments, returning the keyword arguments for the tool."""
+        try:
+            args = json.loads(raw_arguments or "{}")
+        except json.JSONDecodeError as e:
+            raise ToolArgumentError(f"Arguments for {self.name} are not valid JSON: {e}")
+        if not isinstance(args, dict):
+            raise ToolArgumentError(f"Arguments for {self.name} must be a JSON object")
+
+        unknown = args.keys() - self._validators.keys()
+        if unknown:
+            raise ToolArgumentError(f"Unknown argument(s) for {self.name}: {sorted(unknown)}")
+        missing = [name for name in self._required if name not in args]
+        if missing:
+            raise ToolArgumentError(f"Missing required argument(s) for {self.name}: {missing}")
+
+        return {name: self._validators[name](value) for name, value in args.items()}
+
+
+class ToolRegistry:
+    """Compiled tools of an agent, looked up by name."""
+
+    def __init__(self, tools):
+        self._tools = {}
+        for func in tools:
+            compiled = CompiledTool(func)
+            self._tools[compiled.name] = compiled
+        self.schemas = [compiled.schema for compiled in self._tools.values()]
+
+    def __contains__(self, name):
+        return name in self._tools
+
+    def get(self, name):
+        try:
+            return self._tools[name]
+        except KeyError:
+            raise ToolArgumentError(f"Unknown tool {name}")
+
+    def parse_tool_call(self, tool_call):
+        """Returns (compiled_tool, kwargs) for a model tool call, raising ToolArgumentError if it is malformed."""
+        compiled = self.get(tool_call.function.name)
+        return compiled, compiled.parse_arguments(tool_call.function.arguments)
+
+
+def function_to_schema(func) -> dict:
+    return CompiledTool(func).schema
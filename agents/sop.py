@@ -0,0 +1,181 @@
+import os
+import re
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from agents.db import get_connection
+from agents.telemetry import span
+
+load_dotenv()
+
+# Seconds before the in-memory SOP catalog is reloaded from the ufo_sop table
+SOP_CACHE_TTL = float(os.getenv("SOP_CACHE_TTL", "300"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize(value):
+    """Normalizes an SOP key for lookups: case-insensitive with collapsed whitespace."""
+    if value is None:
+        return ""
+    return _WHITESPACE.sub(" ", str(value)).strip().lower()
+
+
+def _load_sop_rows():
+    with get_connection() as connection:
+        with connection.cursor() as cursor, span("db", "load_sop") as db_span:
+            cursor.execute("SELECT * FROM ufo_sop ORDER BY id;")
+            rows = cursor.fetchall()
+            db_span.set(rows=len(rows))
+            columns = [desc[0] for desc in cursor.description]
+    return columns, [dict(zip(columns, row)) for row in rows]
+
+
+class SopCatalog:
+    """
+    In-memory, indexed copy of the ufo_sop table.
+
+    Rows are indexed by error_code, by normalized error_description and by
+    each transaction type listed in transaction_type (e.g. "Deactivation,
+    Suspend" is indexed under both). The catalog reloads itself once the TTL
+    has expired or after invalidate() has been called; if a reload fails the
+    previous snapshot keeps being served.
+    """
+
+    def __init__(self, ttl=SOP_CACHE_TTL, loader=_load_sop_rows):
+        self.ttl = ttl
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._columns = []
+        self._rows = []
+        self._by_code = {}
+        self._by_description = {}
+        self._by_transaction_type = {}
+        self._loaded_at = None
+        self._stale = True
+        self._text = None
+
+    def refresh(self):
+        """Reloads the SOP table and rebuilds the indexes."""
+        columns, rows = self._loader()
+
+        by_code = {}
+        by_description = {}
+        by_transaction_type = {}
+        for row in rows:
+            by_code.setdefault(normalize(row.get("error_code")), []).append(row)
+            by_description.setdefault(normalize(row.get("error_description")), []).append(row)
+            for transaction_type in str(row.get("transaction_type") or "").split(","):
+                by_transaction_type.setdefault(normalize(transaction_type), []).append(row)
+
+        with self._lock:
+            self._columns = columns
+            self._rows = rows
+            self._by_code = by_code
+            self._by_description = by_description
+            self._by_transaction_type = by_transaction_type
+            self._text = None
+            self._loaded_at = time.monotonic()
+            self._stale = False
+
+    def invalidate(self):
+        """Signals that ufo_sop changed; the next lookup reloads the catalog."""
+        with self._lock:
+            self._stale = True
+
+    def _ensure_fresh(self):
+        with self._lock:
+            expired = (
+                self._stale
+                or self._loaded_at is None
+                or time.monotonic() - self._loaded_at >= self.ttl
+            )
+            loaded = self._loaded_at is not None
+        if not expired:
+            return
+        try:
+            self.refresh()
+        except Exception as e:
+            if not loaded:
+                raise
+            print(f"Error refreshing the UFO SOP catalog, serving previous snapshot: {e}")
+
+    @property
+    def columns(self):
+        self._ensure_fresh()
+        return list(self._columns)
+
+    def rows(self):
+        self._ensure_fresh()
+        return list(self._rows)
+
+    def lookup(self, error_code=None, error_description=None, transaction_type=None):
+        """
+        Returns the SOP rows matching an error code and, when given, narrowed
+        by error description and transaction type.
+
+        Narrowing filters that would eliminate every candidate are ignored, so
+        an unexpected description or transaction type never hides the rows
+        that match the error code.
+        """
+        self._ensure_fresh()
+        code = normalize(error_code)
+        description = normalize(error_description)
+        txn_type = normalize(transaction_type)
+
+        if code:
+            candidates = self._by_code.get(code, [])
+        elif description:
+            candidates = self._by_description.get(description, [])
+        else:
+            return []
+
+        if description and len(candidates) > 1:
+            exact = [row for row in candidates if normalize(row.get("error_description")) == description]
+            partial = exact or [
+                row for row in candidates
+                if description in normalize(row.get("error_description"))
+                or normalize(row.get("error_description")) in description
+            ]
+            candidates = partial or candidates
+
+        if txn_type and len(candidates) > 1:
+            applicable = self._by_transaction_type.get(txn_type, []) + self._by_transaction_type.get("all", [])
+            applicable_ids = {id(row) for row in applicable}
+            candidates = [row for row in candidates if id(row) in applicable_ids] or candidates
+
+        return list(candidates)
+
+    def format_rows(self, rows):
+        """Renders rows in the pipe-delimited, header-first layout used by the SOP tools."""
+        columns = self.columns
+        result_string = "|".join(columns) + "\n"
+        for row in rows:
+            result_string += "|".join(str(row.get(column)) for column in columns) + "\n"
+        return result_string
+
+    def text(self):
+        """
+        Returns the whole catalog in the format_rows layout, rendered once per load.
+
+        Rows come ordered by id, so reloading an unchanged table renders the
+        exact same text.
+        """
+        self._ensure_fresh()
+        with self._lock:
+            text = self._text
+        if text is None:
+            text = self.format_rows(self.rows())
+            with self._lock:
+                self._text = text
+        return text
+
+
+sop_catalog = SopCatalog()
+
+
+def invalidate_sop_catalog():
+    """Change signal for the shared SOP catalog, e.g. after the ufo_sop table is edited."""
+    sop_catalog.invalidate()
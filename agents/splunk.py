@@ -0,0 +1,162 @@
+import json
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+from agents.nbp_log import field_values
+from agents.telemetry import metrics, span
+
+load_dotenv()
+
+# Splunk query API used to look up NBP logs
+SPLUNK_URL = os.getenv(
+    "SPLUNK_URL",
+    "https://splunk-query-accenture-poc-application.apps.cluster-gdm2g.gdm2g.sandbox1647.opentlc.com/search",
+)
+SPLUNK_COOKIE = os.getenv("SPLUNK_COOKIE", "cd67134e12541f7d6958784e76a83787=32723587ad3d005624226c556d17f279")
+SPLUNK_INDEX = os.getenv("SPLUNK_INDEX", "main")
+SPLUNK_CONNECT_TIMEOUT = float(os.getenv("SPLUNK_CONNECT_TIMEOUT", "3.05"))
+SPLUNK_READ_TIMEOUT = float(os.getenv("SPLUNK_READ_TIMEOUT", "30"))
+SPLUNK_MAX_RETRIES = int(os.getenv("SPLUNK_MAX_RETRIES", "3"))
+SPLUNK_BACKOFF_BASE = float(os.getenv("SPLUNK_BACKOFF_BASE", "0.5"))
+SPLUNK_BACKOFF_MAX = float(os.getenv("SPLUNK_BACKOFF_MAX", "8"))
+SPLUNK_POOL_SIZE = int(os.getenv("SPLUNK_POOL_SIZE", "16"))
+SPLUNK_BATCH_SIZE = int(os.getenv("SPLUNK_BATCH_SIZE", "50"))
+
+# Responses worth retrying: rate limiting and transient server-side failures
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class SplunkError(Exception):
+    """Raised when the splunk query API could not be searched."""
+
+
+class SplunkClient:
+    """
+    Client for the splunk query API.
+
+    Keeps one keep-alive session with a connection pool sized for the batch
+    workers, applies connect/read timeouts to every request, and retries
+    connection errors, timeouts and retryable statuses with exponential
+    backoff and full jitter.
+    """
+
+    def __init__(self, url=SPLUNK_URL, cookie=SPLUNK_COOKIE, index=SPLUNK_INDEX,
+                 timeout=(SPLUNK_CONNECT_TIMEOUT, SPLUNK_READ_TIMEOUT), max_retries=SPLUNK_MAX_RETRIES,
+                 backoff_base=SPLUNK_BACKOFF_BASE, backoff_max=SPLUNK_BACKOFF_MAX,
+                 pool_size=SPLUNK_POOL_SIZE, batch_size=SPLUNK_BATCH_SIZE):
+        self.url = url
+        self.index = index
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.batch_size = batch_size
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+        if cookie:
+            self.session.headers["Cookie"] = cookie
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def search(self, search_term):
+        """Runs a search and returns its list of result events."""
+        data = json.dumps({"search_term": search_term, "index": self.index})
+        last_error = None
+        with span("splunk", "search") as splunk_span:
+            for attempt in range(self.max_retries + 1):
+                if attempt:
+                    time.sleep(self._backoff(attempt - 1))
+                splunk_span.set(attempts=attempt + 1)
+                try:
+                    response = self.session.post(self.url, data=data, timeout=self.timeout)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    last_error = f"{type(e).__name__}: {e}"
+                    continue
+
+                splunk_span.set(status_code=response.status_code)
+                if response.status_code in RETRYABLE_STATUS_CODES:
+                    last_error = f"Error: {response.status_code}, {response.text}"
+                    continue
+                if response.status_code != 200:
+                    raise SplunkError(f"Error: {response.status_code}, {response.text}")
+
+                try:
+                    results = response.json().get("results") or []
+                except ValueError as e:
+                    raise SplunkError(f"Invalid response from splunk: {e}")
+                splunk_span.set(results=len(results))
+                return results
+
+            raise SplunkError(f"{last_error} (after {self.max_retries + 1} attempts)")
+
+    def find_log(self, integration_id):
+        """Returns the raw NBP log line for an integration_id, or None if there is none."""
+        results = self.search(f" {integration_id} ")
+        if not results:
+            return None
+        return results[0]["_raw"]
+
+    def find_logs(self, integration_ids, confirm_missing=True):
+        """
+        Fetches the NBP logs of many integration IDs with one OR'd search per batch.
+
+        Results are demultiplexed back to their integration ID by an exact
+        match of the ID against the log's '|' separated fields, wherever the
+        field sits; a log whose fields match several of the batch's IDs is
+        ambiguous and attributed to none of them. A batch search may be capped,
+        so IDs it did not return are searched again one at a time before they
+        are reported as having no log; with confirm_missing=False they are left
+        out of the result instead. Returns {integration_id: raw log or None};
+        like find_log, the first result for an ID wins.
+        """
+        ids = list(dict.fromkeys(integration_ids))
+        logs = {}
+        for start in range(0, len(ids), self.batch_size):
+            chunk = ids[start:start + self.batch_size]
+            pending = set(chunk)
+            results = self.search(" (" + " OR ".join(chunk) + ") ")
+            for result in results:
+                matches = pending & field_values(result.get("_raw") or "")
+                if len(matches) == 1:
+                    integration_id = matches.pop()
+                    logs[integration_id] = result["_raw"]
+                    pending.discard(integration_id)
+                if not pending:
+                    break
+            if results and len(pending) == len(chunk):
+                # The search found logs but none of them carries one of the IDs as a field
+                print(f"Warning: splunk batch search returned {len(results)} log(s) but none matched its {len(chunk)} integration ID(s)")
+                metrics.inc("ufo_splunk_unattributed_batches_total", 1,
+                            "Batched splunk searches whose results could not be attributed to any integration ID.")
+            for integration_id in [i for i in chunk if i in pending]:
+                if confirm_missing:
+                    logs[integration_id] = self.find_log(integration_id)
+        return {integration_id: logs[integration_id] for integration_id in ids if integration_id in logs}
+
+    def close(self):
+        self.session.close()
+
+
+_splunk_client = None
+_splunk_client_lock = threading.Lock()
+
+
+def get_splunk_client():
+    """Returns the process-wide splunk client, creating its session on first use."""
+    global _splunk_client
+    if _splunk_client is None:
+        with _splunk_client_lock:
+            if _splunk_client is None:
+                _splunk_client = SplunkClient()
+    return _splunk_client
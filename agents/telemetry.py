@@ -0,0 +1,339 @@
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Spans around model calls, tool calls, database queries and splunk requests
+TELEMETRY_ENABLED = os.getenv("TELEMETRY_ENABLED", "true").lower() == "true"
+# JSONL file receiving one line per finished span; empty disables the trace file
+TRACE_PATH = os.getenv("TRACE_PATH", "")
+# Port of the Prometheus text endpoint (GET /metrics); 0 disables it
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+SPAN_DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Longest error message kept on a span; spans never carry request or response payloads
+MAX_ERROR_CHARS = 200
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class MetricsRegistry:
+    """
+    In-process counters and histograms, rendered in the Prometheus text format.
+
+    Collectors registered with register_collector() are called at render time
+    and their numeric values are exported as gauges (e.g. the connection pool
+    and cache statistics), so they cost nothing between scrapes.
+    """
+
+    def __init__(self, buckets=SPAN_DURATION_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = {}
+
+    def _describe(self, metric, kind, description):
+        if metric not in self._help:
+            self._help[metric] = (kind, description)
+
+    def inc(self, metric, value=1, description="", **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            self._describe(metric, "counter", description)
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, metric, value, description="", **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            self._describe(metric, "histogram", description)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram["buckets"][index] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def register_collector(self, prefix, collect):
+        """Exports the numeric values of collect() -> dict as gauges named <prefix>_<key>."""
+        with self._lock:
+            self._collectors[prefix] = collect
+
+    def counter_value(self, metric, **labels):
+        with self._lock:
+            return self._counters.get((metric, tuple(sorted(labels.items()))), 0)
+
+    def render(self):
+        """Returns all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: dict(value, buckets=list(value["buckets"])) for key, value in self._histograms.items()}
+            descriptions = dict(self._help)
+            collectors = dict(self._collectors)
+
+        lines = []
+        described = set()
+
+        def describe(name, kind, description):
+            if name not in described:
+                described.add(name)
+                if description:
+                    lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in sorted(counters.items()):
+            describe(name, "counter", descriptions[name][1])
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for (name, labels), histogram in sorted(histograms.items()):
+            describe(name, "histogram", descriptions[name][1])
+            for bound, count in zip(self.buckets, histogram["buckets"]):
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+
+        for prefix, collect in sorted(collectors.items()):
+            try:
+                values = collect() or {}
+            except Exception as e:
+                print(f"Metrics collector {prefix} failed: {e}")
+                continue
+            for key, value in sorted(values.items()):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"{prefix}_{key}"
+                describe(name, "gauge", "")
+                lines.append(f"{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+class TraceWriter:
+    """Appends finished spans as JSON lines to the trace file."""
+
+    def __init__(self, path=TRACE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def write(self, record):
+        if not self.path:
+            return
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            if self._file is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._file = open(self.path, "a", buffering=1)
+            self._file.write(line)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+trace_writer = TraceWriter()
+
+atexit.register(trace_writer.close)
+
+_current_span = ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    A timed stage of an agent turn: a model call, tool call, database query or splunk request.
+
+    Spans nest through a context variable, so a tool span started inside a
+    turn shares its trace_id, across threads only when the context is copied.
+    On exit the duration is recorded in `metrics` and the span is written to
+    the trace file with its attributes.
+    """
+
+    def __init__(self, kind, name, attributes):
+        self.kind = kind
+        self.name = name
+        self.attributes = attributes
+        self.status = "ok"
+        self.error = None
+        self.duration = None
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = None
+        self.trace_id = None
+        self._token = None
+        self._start = None
+        self._started_at = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+        return self
+
+    def record_usage(self, usage):
+        """Adds the token counts of a chat completion's `usage` to the span and the token counters."""
+        if usage is None:
+            return
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        # Prompt tokens the model server served from its prefix cache, when it reports them
+        cached_prompt_tokens = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", 0) or 0
+        self.set(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, cached_prompt_tokens=cached_prompt_tokens)
+        # Cached completions replay the usage of the original call; they cost no tokens now
+        if self.attributes.get("cache") == "hit":
+            return
+        agent = self.attributes.get("agent", "")
+        for token_type, count in (("prompt", prompt_tokens), ("cached_prompt", cached_prompt_tokens),
+                                  ("completion", completion_tokens)):
+            metrics.inc("ufo_llm_tokens_total", count, "Tokens used by model calls.",
+                        agent=agent, model=self.name, type=token_type)
+
+    def __enter__(self):
+        parent = _current_span.get()
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self._token = _current_span.set(self)
+        self._start = time.perf_counter()
+        self._started_at = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self._start
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Exited from another context, e.g. a streaming generator closed by the garbage collector
+            pass
+        if exc_type is not None and not issubclass(exc_type, GeneratorExit):
+            self.status = "error"
+            self.error = f"{exc_type.__name__}: {exc}"[:MAX_ERROR_CHARS]
+        self._finish()
+        return False
+
+    def _finish(self):
+        agent = self.attributes.get("agent", "")
+        metrics.observe("ufo_span_duration_seconds", self.duration, "Duration of agent stages.",
+                        kind=self.kind, name=self.name, agent=agent)
+        metrics.inc("ufo_spans_total", 1, "Finished agent stages by status.",
+                    kind=self.kind, name=self.name, agent=agent, status=self.status)
+        record = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "kind": self.kind,
+            "name": self.name,
+            "start": self._started_at,
+            "duration_seconds": round(self.duration, 6),
+            "status": self.status,
+        }
+        if self.error:
+            record["error"] = self.error
+        record.update(self.attributes)
+        trace_writer.write(record)
+
+
+class _NoopSpan:
+    attributes = {}
+
+    def set(self, **attributes):
+        return self
+
+    def record_usage(self, usage):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_noop_span = _NoopSpan()
+
+
+def span(kind, name, **attributes):
+    """
+    Times a with-block as a span of the given kind ("turn", "llm", "tool", "db", "splunk").
+
+    Attributes are small scalars (agent, iteration, tool, row counts); never pass
+    prompts, tool results or log lines.
+    """
+    if not TELEMETRY_ENABLED:
+        return _noop_span
+    return Span(kind, name, attributes)
+
+
+def current_span():
+    """Returns the innermost active span, or a no-op span outside of any span."""
+    return _current_span.get() or _noop_span
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    """
+    Serves `metrics` in the Prometheus text format on GET /metrics from a daemon thread.
+
+    Does nothing when port is 0; safe to call repeatedly, the server is started once per process.
+    Metrics never stop the workload: if the port cannot be bound (e.g. the UI already serves
+    metrics on it), the error is logged and None is returned.
+    """
+    global _server
+    if not port:
+        return None
+    with _server_lock:
+        if _server is not None:
+            return _server
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                payload = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        try:
+            _server = ThreadingHTTPServer((host, port), Handler)
+        except OSError as e:
+            print(f"Unable to serve metrics on {host}:{port}, continuing without the metrics endpoint: {e}")
+            return None
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        print(f"Serving metrics on http://{host}:{port}/metrics")
+        return _server
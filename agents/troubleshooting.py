@@ -1,78 +1,50 @@
-import psycopg2
 from psycopg2 import OperationalError
-from openai import OpenAI
-from typing import Optional
-import httpx
-import inspect
-from mistralai import Mistral
-from pydantic import BaseModel
+import argparse
+import contextlib
+import contextvars
 import json
+import csv
+import sys
 import time
-import requests
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import os
-import httpx
+from agents.db import get_connection
+from agents.splunk import SplunkError
+import agents.log_cache as nbp_logs
+from agents.nbp_log import parse_nbp_log, error_code as nbp_error_code
+from agents.writer import resolution_writer, WriterQueueFullError
+from agents.context import as_message_dict
+from agents.core import Agent, seeded_tool_call
+from agents.turn import run_turn
+from agents.telemetry import METRICS_PORT, span, start_metrics_server
+from agents.sop import sop_catalog, normalize
+from agents.batch import TokenBucket, iter_batch, BATCH_MAX_WORKERS, LLM_RATE_LIMIT_PER_SECOND, LLM_RATE_LIMIT_BURST
 
 
 load_dotenv()
 
-MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
 MISTRAL_MODEL = os.getenv("MISTRAL_MODEL")
-MISTRAL_BASE_URL = os.getenv("MISTRAL_BASE_URL")
 
-# Database connection constants
-DB_HOST = os.getenv("DB_HOST")
-DB_DATABASE = os.getenv("DB_DATABASE")
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-DB_PORT = os.getenv("DB_PORT")
+# Resolve clear-cut orders in plain Python and only use the LLM for the rest
+TROUBLESHOOT_FAST_PATH = os.getenv("TROUBLESHOOT_FAST_PATH", "true").lower() == "true"
+# Run the predictable first tool call (NBP log search) before the agent's first model call
+TROUBLESHOOT_PREFETCH = os.getenv("TROUBLESHOOT_PREFETCH", "true").lower() == "true"
 
 def retrieve_sop():
     """ Retrieves the sop list which contains error code, error description, root rause and next action """
 
     try:
-        # Establish the connection to the PostgreSQL database using constant values
-        connection = None
-        connection = psycopg2.connect(
-            host=DB_HOST,
-            database=DB_DATABASE,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            port=DB_PORT
-        )
-        
-        # Create a cursor object using the connection
-        cursor = connection.cursor()
-        result = []
-        
-        # print("Connection to PostgreSQL database established successfully!")
-        
-        # Write the SQL query to fetch the order status based on the order_id
-        query = "SELECT * FROM ufo_sop;"
-        
-        # Execute the query with the provided order_id
-        cursor.execute(query)
-        
-        # Fetch the result
-        
-        result = cursor.fetchall()
-        
-        # If result is None, it means the order_id was not found
-        if not result:
-            print(f"No order found with order_id {order_id}.")
-            return f"No order found with order_id {order_id}."
-
-        # Get the column name(s) from the cursor description (metadata)
-        column_names = [desc[0] for desc in cursor.description]
-        
-        result_string = "|".join(column_names) + "\n"  # Add column headers
-
-        for row in result:
-            result_string += "|".join(map(str, row)) + "\n"
+        # Served from the in-memory SOP catalog, which reloads ufo_sop on its TTL
+        result = sop_catalog.rows()
 
+        # If result is empty, the SOP table has not been populated
+        if not result:
+            print("No SOP found in the ufo_sop table.")
+            return "No SOP found in the ufo_sop table."
 
         #print(result_string)
-        return result_string
+        return sop_catalog.format_rows(result)
                 
     except OperationalError as e:
         print(f"Error: {e}")
@@ -80,97 +52,64 @@ def retrieve_sop():
     except Exception as e:
         print(f"Error querying the UFO SOP: {e}")
         return None
-    finally:
-        # Ensure the cursor and connection are closed
-        if connection:
-            cursor.close()
-            connection.close()
-            # print("Connection closed.")
-
-def function_to_schema(func) -> dict:
-    type_map = {
-        str: "string",
-        int: "integer",
-        float: "number",
-        bool: "boolean",
-        list: "array",
-        dict: "object",
-        type(None): "null",
-    }
+
+def sop_reference():
+    """ The full SOP catalog, placed after the troubleshooting instructions in the static prompt prefix """
 
     try:
-        signature = inspect.signature(func)
-    except ValueError as e:
-        raise ValueError(
-            f"Failed to get signature for function {func.__name__}: {str(e)}"
-        )
-
-    parameters = {}
-    for param in signature.parameters.values():
-        try:
-            param_type = type_map.get(param.annotation, "string")
-        except KeyError as e:
-            raise KeyError(
-                f"Unknown type annotation {param.annotation} for parameter {param.name}: {str(e)}"
-            )
-        parameters[param.name] = {"type": param_type}
-
-    required = [
-        param.name
-        for param in signature.parameters.values()
-        if param.default == inspect._empty
-    ]
-
-    return {
-        "type": "function",
-        "function": {
-            "name": func.__name__,
-            "description": (func.__doc__ or "").strip(),
-            "parameters": {
-                "type": "object",
-                "properties": parameters,
-                "required": required,
-            },
-        },
-    }
-
-def check_order_status(order_id):
+        return "SOP catalog:\n" + sop_catalog.text()
+    except Exception as e:
+        print(f"Error loading the UFO SOP catalog: {e}")
+        return "SOP catalog: unavailable, use the lookup sop tool."
+
+def lookup_sop(error_code: str, error_description: str = "", transaction_type: str = ""):
+    """
+    Looks up only the SOP rows applicable to an NBP error code, optionally narrowed by the NBP error description and the order transaction type (e.g. Activation, Deactivation). Returns the matching SOP rows with the header.
+    """
+
+    try:
+        result = sop_catalog.lookup(error_code, error_description, transaction_type)
+
+        if not result:
+            print(f"No SOP found for error code {error_code}.")
+            return f"No SOP found for error code {error_code}."
+
+        return sop_catalog.format_rows(result)
+
+    except OperationalError as e:
+        print(f"Error: {e}")
+        return None
+    except Exception as e:
+        print(f"Error looking up the UFO SOP: {e}")
+        return None
+
+def check_order_status(order_id: str):
     """Check the status of an order by connecting to the PostgreSQL database."""
     try:
-        # Establish the connection to the PostgreSQL database using constant values
-        connection = None
-        connection = psycopg2.connect(
-            host=DB_HOST,
-            database=DB_DATABASE,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            port=DB_PORT
-        )
-        
-        # Create a cursor object using the connection
-        cursor = connection.cursor()
-        result = []
-        
-        print("Connection to PostgreSQL database established successfully!")
-        
-        # Write the SQL query to fetch the order status based on the order_id
-        query = "SELECT * FROM order_resolution WHERE order_id = %s;"
-        
-        # Execute the query with the provided order_id
-        cursor.execute(query, (order_id,))
-        
-        # Fetch the result
-        
-        result = cursor.fetchall()
-        
+        # Borrow a connection from the shared pool
+        with get_connection() as connection:
+
+            # Create a cursor object using the connection
+            with connection.cursor() as cursor:
+
+                # Write the SQL query to fetch the order status based on the order_id
+                query = "SELECT * FROM order_resolution WHERE order_id = %s;"
+
+                # Execute the query with the provided order_id
+                with span("db", "check_order_status"):
+                    cursor.execute(query, (order_id,))
+
+                    # Fetch the result
+                    result = cursor.fetchall()
+
+                # Get the column name(s) from the cursor description (metadata)
+                column_names = [desc[0] for desc in cursor.description]
+
         # If result is None, it means the order_id was not found
         if not result:
             print(f"No order found with order_id {order_id}.")
             return f"No order found with order_id {order_id}."
 
-        # Get the column name(s) from the cursor description (metadata)
-        column_names = [desc[0] for desc in cursor.description]
-        
         # Convert each row to a dictionary with column names as keys
         formatted_result_list = [dict(zip(column_names, row)) for row in result]
         
@@ -188,157 +127,41 @@ def check_order_status(order_id):
     except Exception as e:
         print(f"Error querying the order status: {e}")
         return None
-    finally:
-        # Ensure the cursor and connection are closed
-        if connection:
-            cursor.close()
-            connection.close()
-            print("Connection closed.")
-
-# Use this for local only, connect to Mistral Free API
-# client = Mistral(
-#     api_key = MISTRAL_API_KEY,
-# )
-
-# Use this for server
-client = OpenAI(
-    api_key = MISTRAL_API_KEY,
-    base_url = MISTRAL_BASE_URL,
-    http_client = httpx.Client(verify=False),
-)
-
-def run_full_turn(agent, messages):
-
-    current_agent = agent
-    num_init_messages = len(messages)
-    messages = messages.copy()
-    i = 0
-    while True:
-        i+=1
-        print("Iter: " + str(i))
-
-        # turn python functions into tools and save a reverse map
-        tool_schemas = [function_to_schema(tool) for tool in current_agent.tools]
-        tools = {tool.__name__: tool for tool in current_agent.tools}
-
-        print("Current agent: " + current_agent.name)
-        #print(messages)
-
-        # Use this for local only, connect to Mistral Free API
-        time.sleep(5)
-        # response = client.chat.complete(
-        #     model=MISTRAL_MODEL,
-        #     messages=[{"role": "system", "content": current_agent.instructions}]
-        #     + messages,
-        #     temperature=0.0,
-        #     tools = tool_schemas,
-        #     tool_choice = "auto",
-        # )
-
-        # Use this for server, using OpenAI API
-        response = client.chat.completions.create(
-            model=MISTRAL_MODEL,
-            messages=[{"role": "system", "content": current_agent.instructions}]
-            + messages,
-            temperature=0.0,
-            tools = tool_schemas,
-            tool_choice = "auto",
-        )
-
-        print(response)
-        
-        message = response.choices[0].message
-        messages.append(message)
-
-        if message.content:  # print agent response
-            print(f"{current_agent.name}:", message.content)
-            
-
-        if not message.tool_calls:  # if finished handling tool calls, break
-            break
-
-        for tool_call in message.tool_calls:
-            result = execute_tool_call(tool_call, tools, current_agent.name)
-            print("Tool call completed. Result:")
-            if type(result) is Agent:  # if agent transfer, update current agent
-                current_agent = result
-                result = (
-                    f"Transfered to {current_agent.name}. Adopt persona immediately."
-                )
 
-            result_message = {
-                "role": "tool",
-                "tool_call_id": tool_call.id,
-                "name": tool_call.function.name,
-                "content": result,
-            }
-            print(result_message)
-            messages.append(result_message)
 
-    return Response(agent=current_agent, messages=messages[num_init_messages:])
-
-
-def execute_tool_call(tool_call, tools, agent_name):
-    name = tool_call.function.name
-    args = json.loads(tool_call.function.arguments)
-
-    print(f"{agent_name}:", "Executing tool:", f"{name}({args})")
+order_header = "IH_NUMBER,ORDER_ID,ORDER_TYPE,REASON_CODE,CUSTOMER_ORDER_ID,INTEGRATION_ID,TRANSACTION_ID,ORDER_STATUS,SUBMITTED_DATE,STEP_STATUS,FO_MSG,SRC_SYSTEM,STATUS"
 
-    return tools[name](**args)
 
-class Agent(BaseModel):
-    name: str = "Agent"
-    model: str = MISTRAL_MODEL
-    instructions: str = "You are a helpful Agent"
-    tools: list = []
+def search_nbp_log(integration_id):
+    """
+    Returns the raw NBP log line for the provided integration_id, or None if splunk has no match.
+    """
+    return nbp_logs.find_log(integration_id)
 
-class Response(BaseModel):
-    agent: Optional[Agent]
-    messages: list
 
-order_header = "IH_NUMBER,ORDER_ID,ORDER_TYPE,REASON_CODE,CUSTOMER_ORDER_ID,INTEGRATION_ID,TRANSACTION_ID,ORDER_STATUS,SUBMITTED_DATE,STEP_STATUS,FO_MSG,SRC_SYSTEM,STATUS"
-
-order_list = [
-    "190000000084,12192911,MO,REPLACE,MOk4250122101016354922640,0V168ZENE6FB5IL5K9385QEXD,k41948e9068ee18451000886482b4f6Icu60000G000,Failed,1/22/2025 22:13,Failed,Internal Server Error,NBP,OPEN",
-    "190000000040,9559589,AO,CREQ,AOi42501070329122268949f0,0Y4NODJ3VCUNDGOFNY6RYP14V,i41943fe35e5d12252000769112b696Iar70000G000,Failed,1/7/2025 15:30,Failed,FAILED - NONRETRY,NBP,OPEN",
-    "190000000080,12803690,MO,REPLACE,MOk42501300904219745e55a0,R0HUEMVC1IY0ZUM7XMS0ALMAP,k4194b4f3c42411461000952002c969Icr00000G000,Failed,1/30/2025 9:35,Failed,FAILED - RETRY,NBP,OPEN",
-    "190000000001,9900736,MO,CREQ,MOi12501201000339579db630,A301250120220033785071030,s018737aa0048071030007859900000Iaub00001000,Failed,1/20/2025 22:00,Failed,FAILED - NONRETRY,NBP,OPEN",
-    "190000000002,9883174,MO,CREQ,MOi12501200146366456a97c0,A301250120134636702270570,s0184d5bb55fc270570007859900000Iaub00001000,Failed,1/20/2025 13:46,Failed,FAILED - NONRETRY,NBP,OPEN",
-    "190000000003,9872457,MO,CREQ,MOi125012009210093641d5b0,A301250120092059545006690,s018737e27342006690007859900000Iaub00001000,Failed,1/20/2025 9:21,Failed,FAILED - NONRETRY,NBP,OPEN",
-    "190000000004,9865636,MO,CREQ,MOi12501190613532282c4b90,A301250119181352662014260,s018737a769a0014260007859900000Iaub00001000,Failed,1/19/2025 18:13,Failed,FAILED - NONRETRY,NBP,OPEN",
-    "190000000005,9861185,MO,CREQ,MOi1250119032647578919690,A301250119152647423560490,s0187379a1ace560490007859900000Iaub00001000,Failed,1/19/2025 15:26,Failed,FAILED - NONRETRY,NBP,OPEN",
-]
+def search_nbp_logs(integration_ids):
+    """
+    Returns {integration_id: raw NBP log line or None} for many integration IDs using batched splunk searches.
+    """
+    return nbp_logs.find_logs(integration_ids)
 
 
-def find_nbp_log(integration_id):
+def find_nbp_log(integration_id: str, include_raw_log: bool = False):
     """
-    Searches for an NBP log by calling the splunk query API based on the provided integration_id.
+    Searches for an NBP log by calling the splunk query API based on the provided integration_id. Returns the parsed NBP log fields including the NBP error_code; set include_raw_log only if the full raw log line is needed.
     """
 
     nbp_log = "Cannot find the corresponding NBP log bassed on INTEGRATION_ID " + integration_id
 
-    url = 'https://splunk-query-accenture-poc-application.apps.cluster-gdm2g.gdm2g.sandbox1647.opentlc.com/search'
-    headers = {
-        'Content-Type': 'application/json',
-        'Cookie': 'cd67134e12541f7d6958784e76a83787=32723587ad3d005624226c556d17f279'
-    }
-    data = {
-        "search_term": f" {integration_id} ",
-        "index": "main"
-    }
-
-    # Send POST request
-    response = requests.post(url, headers=headers, data=json.dumps(data))
-
-    # Check for successful response
-    if response.status_code == 200:
-        nbp_log = "Found NBP log: " + response.json()["results"][0]["_raw"]
-        # print(nbp_log)
-    else:
-        nbp_log += f". Error: {response.status_code}, {response.text}"
+    try:
+        raw_log = search_nbp_log(integration_id)
+    except SplunkError as e:
+        return nbp_log + f". {e}"
 
+    if raw_log is None:
+        return nbp_log
 
-    return nbp_log
+    return "Found NBP log: " + json.dumps(parse_nbp_log(raw_log, integration_id, include_raw_log))
 
 # def update_order_resolution(order_id, root_cause, next_action):
 #     """ Updates the root cause and next action field in the order_resolution table"""
@@ -362,7 +185,7 @@ def update_order_resolution(ih_number: str, order_id: str, customer_order_id: st
         action_taken (str): Next action taken (max 255 chars)
     
     Returns:
-        bool: True if insertion successful, False otherwise
+        str: Queued once the record is queued for the resolution writer, Error otherwise
     """
 
     print(ih_number)
@@ -376,36 +199,8 @@ def update_order_resolution(ih_number: str, order_id: str, customer_order_id: st
     print(action_taken)
 
     try:
-        # Establish database connection
-        connection = None
-        connection = psycopg2.connect(
-            host=DB_HOST,
-            database=DB_DATABASE,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            port=DB_PORT
-        )
-        
-        # Create cursor
-        cursor = connection.cursor()
-        
-        # SQL insert query
-        insert_query = """
-            INSERT INTO UFO_ORDER_RESOLUTION (
-                ih_number,
-                order_id,
-                customer_order_id,
-                integration_id,
-                transaction_id,
-                submitted_date,
-                system,
-                root_cause_analysis,
-                action_taken
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """
-        
-        # Execute the insert
-        cursor.execute(insert_query, (
+        # Queued for the background writer, which inserts resolutions in group commits
+        resolution_writer.submit((
             ih_number,
             order_id,
             customer_order_id,
@@ -416,23 +211,12 @@ def update_order_resolution(ih_number: str, order_id: str, customer_order_id: st
             root_cause_analysis,
             action_taken
         ))
-        
-        # Commit the transaction
-        connection.commit()
-        return "Success: updated resolution table for this order."
-        
-    except psycopg2.Error as e:
+        # Written by the background writer; a failed write is reported with the batch results
+        return "Queued: resolution for this order will be written to the resolution table."
+
+    except WriterQueueFullError as e:
         print(f"Database error occurred: {e}")
-        if 'connection' in locals():
-            connection.rollback()
         return "Error: unable to update resolution for this order."
-        
-    finally:
-        # Clean up
-        if 'cursor' in locals():
-            cursor.close()
-        if 'connection' in locals():
-            connection.close()
 
 troubleshooting_agent = Agent(
     name="Troubleshooting Agent",
@@ -446,25 +230,267 @@ troubleshooting_agent = Agent(
         if NBP log is not found, inform the user that you are unable to troubleshoot the issue since there is no NBP log is found.
 
         if the NBP log is found,:
-            1. return the NBP error which is in the 35th position of the nbp log, separated by '|'
-            2. retrieve sop
-            3. find which sop is applicable based on the NBP error and return the SOP with the header
+            1. return the NBP error which is the error_code field of the nbp log
+            2. find the SOP rows for the NBP error code in the SOP catalog at the end of these instructions; only if the catalog is unavailable, lookup sop using the NBP error code, and the error description and transaction type if available
+            3. find which of those sop is applicable based on the NBP error and return the SOP with the header
             4. update the order resolution table based with the following details, follow the sequence order: ih_number, order_id, customer_order_id, integration_id, transaction_id, submitted_date, system, root_cause_analysis, action_taken,
             5. Once completed summarize the list of actions performed. Remember to always generate the summary!
+
+        The NBP log may already be in the conversation; use it instead of searching for it again.
     """,
-    tools=[retrieve_sop, find_nbp_log, update_order_resolution],
+    tools=[lookup_sop, find_nbp_log, update_order_resolution],
     tool_choice = "any",
+    reference=sop_reference,
 )
 
 agent = troubleshooting_agent
 
-for order in order_list:
+llm_rate_limiter = TokenBucket(rate=LLM_RATE_LIMIT_PER_SECOND, capacity=LLM_RATE_LIMIT_BURST)
+
+def parse_order(order):
+    """Parses an order row in the order_header format into a dict keyed by column name."""
+    columns = order_header.split(",")
+    values = next(csv.reader([order]))
+    if len(values) != len(columns):
+        raise ValueError(f"Expected {len(columns)} order fields, got {len(values)}: {order}")
+    return dict(zip(columns, values))
+
+def match_sop(error_code, nbp_log):
+    """
+    Returns the single SOP row applicable to an NBP error, or None if the match is ambiguous.
+
+    When an error code has several SOP rows, the row whose error description appears in the
+    NBP log is chosen; rows that all prescribe the same root cause and action are equivalent.
+    """
+    rows = sop_catalog.lookup(error_code)
+    if len(rows) > 1:
+        log_text = normalize(nbp_log)
+        described = [
+            row for row in rows
+            if normalize(row.get("error_description")) and normalize(row.get("error_description")) in log_text
+        ]
+        if len(described) == 1:
+            rows = described
+    if not rows:
+        return None
+    outcomes = {(row.get("root_cause"), row.get("next_action")) for row in rows}
+    if len(outcomes) != 1:
+        return None
+    return rows[0]
+
+def resolve_order_fast(order):
+    """
+    Troubleshoots an order without the LLM when its NBP error maps to exactly one SOP.
+
+    Returns the summary of actions performed, or None when the order needs the troubleshooting
+    agent (NBP log missing, error code unreadable, SOP catalog unavailable or SOP match ambiguous).
+    """
+    details = parse_order(order)
+    try:
+        nbp_log = search_nbp_log(details["INTEGRATION_ID"])
+    except SplunkError as e:
+        print(f"Fast path skipped for {details['IH_NUMBER']}: {e}")
+        return None
+    if nbp_log is None:
+        return None
+
+    error_code = nbp_error_code(nbp_log)
+    if error_code is None:
+        return None
+
+    try:
+        sop = match_sop(error_code, nbp_log)
+    except Exception as e:
+        # SOP catalog unavailable (e.g. database down); the troubleshooting agent handles the order
+        print(f"Fast path skipped for {details['IH_NUMBER']}: unable to load the UFO SOP catalog: {e}")
+        return None
+    if sop is None:
+        return None
+
+    update_result = update_order_resolution(
+        details["IH_NUMBER"],
+        details["ORDER_ID"],
+        details["CUSTOMER_ORDER_ID"],
+        details["INTEGRATION_ID"],
+        details["TRANSACTION_ID"],
+        details["SUBMITTED_DATE"],
+        details["SRC_SYSTEM"],
+        sop["root_cause"],
+        sop["next_action"],
+    )
+    if not update_result.startswith("Queued"):
+        return None
+
+    return (
+        f"Order {details['IH_NUMBER']} resolved without the LLM:\n"
+        f"1. Found the NBP log for INTEGRATION_ID {details['INTEGRATION_ID']}\n"
+        f"2. NBP error: {error_code}\n"
+        f"3. Applicable SOP {sop['id']}: {sop['error_description']} - root cause: {sop['root_cause']}, next action: {sop['next_action']}\n"
+        f"4. {update_result}"
+    )
+
+def prewarm_nbp_logs(orders):
+    """
+    Fetches the NBP logs of many orders into the NBP log cache with batched splunk searches,
+    so the per-order lookups of a batch run are served locally. Returns the number of logs found.
+    """
+    integration_ids = []
+    for order in orders:
+        try:
+            integration_ids.append(parse_order(order)["INTEGRATION_ID"])
+        except ValueError:
+            # Malformed rows are reported when the order itself is troubleshot
+            continue
+    logs = search_nbp_logs(integration_ids)
+    found = sum(1 for raw_log in logs.values() if raw_log is not None)
+    print(f"Prewarmed NBP logs: {found} of {len(logs)} found")
+    return found
+
+_prefetch_executor = ThreadPoolExecutor(max_workers=BATCH_MAX_WORKERS, thread_name_prefix="troubleshooting-prefetch")
+
+def prefetch_tool_results(agent, messages):
+    """
+    The troubleshooting agent's prelude: speculatively runs the tool call every troubleshooting
+    turn starts with, find_nbp_log for the order's INTEGRATION_ID, while the SOP catalog for the
+    system prompt is refreshed concurrently.
+
+    The SOP rows themselves are not injected: the whole catalog is already part of the agent's
+    cached system prompt. Returns the assistant tool call message and the tool result message to
+    seed the conversation with, or [] when the latest message is not an order row.
+    """
+    if not TROUBLESHOOT_PREFETCH or not messages:
+        return []
+    message = as_message_dict(messages[-1])
+    if message.get("role") != "user":
+        return []
+    try:
+        details = parse_order(str(message.get("content") or "").strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        return []
+
+    # Only a database read when the catalog's TTL has expired, overlapped with the splunk search
+    sop_ready = _prefetch_executor.submit(contextvars.copy_context().run, sop_reference)
+    try:
+        return seeded_tool_call(agent, "find_nbp_log", {"integration_id": details["INTEGRATION_ID"]}, prefetched=True)
+    finally:
+        sop_ready.result()
+
+troubleshooting_agent.prelude = prefetch_tool_results
+
+def troubleshoot_order(order):
+    """Troubleshoots a single order row, using the deterministic fast path when possible, and returns its final summary."""
+    if TROUBLESHOOT_FAST_PATH:
+        summary = resolve_order_fast(order)
+        if summary is not None:
+            print(summary)
+            return summary
+
     messages = []
     order_details = order_header + '\n' + order
     print(order_details)
     messages.append({"role": "user", "content": order_details})
-    response = run_full_turn(agent, messages)
+    response = run_turn(agent, messages, rate_limiter=llm_rate_limiter)
 
     print ("*************************************************")
+    return response.messages[-1].content
+
+def read_orders(lines):
+    """Yields order rows in the order_header format from lines of CSV text, skipping the header and blank lines."""
+    for line in lines:
+        line = line.strip()
+        if not line or line.upper().startswith("IH_NUMBER,"):
+            continue
+        yield line
+
+def prewarmed(orders, chunk_size):
+    """Passes orders through, prewarming the NBP log cache one chunk of `chunk_size` orders ahead."""
+    chunk = []
+    for order in orders:
+        chunk.append(order)
+        if len(chunk) < chunk_size:
+            continue
+        _prewarm_chunk(chunk)
+        yield from chunk
+        chunk = []
+    if chunk:
+        _prewarm_chunk(chunk)
+        yield from chunk
+
+def _prewarm_chunk(orders):
+    try:
+        prewarm_nbp_logs(orders)
+    except SplunkError as e:
+        print(f"Unable to prewarm NBP logs, orders will query splunk individually: {e}")
+
+def main(argv=None):
+    """
+    Troubleshoots failed orders read from a CSV file (or stdin) and writes one JSON line per order.
+
+    Orders are streamed: only the orders in flight and the current prewarm chunk are held in memory.
+    Progress and agent logs go to stderr so that stdout carries only the JSONL results.
+    """
+    global TROUBLESHOOT_FAST_PATH
+
+    parser = argparse.ArgumentParser(
+        prog="python -m agents.troubleshooting",
+        description="Troubleshoot failed UFO orders given in the order_header CSV format.",
+    )
+    parser.add_argument("--input", default="-", help="CSV file of orders, '-' for stdin (default)")
+    parser.add_argument("--output", default="-", help="JSONL file for per-order results, '-' for stdout (default)")
+    parser.add_argument("--workers", type=int, default=BATCH_MAX_WORKERS, help="orders troubleshot concurrently")
+    parser.add_argument("--prewarm-size", type=int, default=500, help="orders per batched NBP log prewarm, 0 to disable")
+    parser.add_argument("--no-fast-path", action="store_true", help="always use the troubleshooting agent")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="port of the Prometheus metrics endpoint, 0 to disable (default METRICS_PORT)")
+    args = parser.parse_args(argv)
+
+    if args.no_fast_path:
+        TROUBLESHOOT_FAST_PATH = False
+    start_metrics_server(port=args.metrics_port)
+
+    source = sys.stdin if args.input == "-" else open(args.input, newline="")
+    output = sys.stdout if args.output == "-" else open(args.output, "w")
+    succeeded = failed = 0
+    started = time.time()
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            orders = read_orders(source)
+            if args.prewarm_size > 0:
+                orders = prewarmed(orders, args.prewarm_size)
+
+            for result in iter_batch(orders, troubleshoot_order, max_workers=args.workers):
+                record = {"ih_number": result.order.split(",")[0]}
+                record.update(result.model_dump())
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+                if result.status == "success":
+                    succeeded += 1
+                else:
+                    failed += 1
+
+            # Make sure every queued resolution reached the database before reporting
+            resolution_writer.flush()
+
+            # Writes happen in the background, so a failed write gets its own record after the order's
+            write_failures = resolution_writer.failures(since=started)
+            for failure in write_failures:
+                output.write(json.dumps({
+                    "ih_number": failure["row"]["ih_number"],
+                    "status": "write_failed",
+                    "write_error": failure["error"],
+                }) + "\n")
+            output.flush()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+
+    print(f"Processed {succeeded + failed} orders: {succeeded} succeeded, {failed} failed", file=sys.stderr)
+    for failure in write_failures:
+        print(f"FAILED to write resolution for {failure['row']['ih_number']}: {failure['error']}", file=sys.stderr)
+    return 1 if failed or write_failures else 0
 
 
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+import contextlib
+import os
+import time
+
+from dotenv import load_dotenv
+
+from agents.context import context_budget
+from agents.llm_cache import cached_completion, cached_completion_stream, completion_from_chunks
+from agents.core import Agent, Response, execute_tool_call, get_client
+from agents.telemetry import span
+
+load_dotenv()
+
+MISTRAL_MODEL = os.getenv("MISTRAL_MODEL")
+
+
+class Turn:
+    """
+    State of one agent turn: the loop of model calls and tool calls until the agent answers.
+
+    Shared by the sync, streaming and asyncio runtimes, which only differ in how
+    they call the model and run the tools:
+
+        turn = Turn(agent, messages, agent.prelude_messages(messages))
+        while True:
+            request = turn.next_request()          # prompt kept within the token budget
+            with turn.llm_span() as llm_span:
+                message = <call the model with request>
+            tool_calls = turn.add_message(message)
+            if not tool_calls:
+                break
+            for tool_call in tool_calls:
+                turn.add_tool_result(tool_call, <run the tool call>)
+        return turn.response()
+
+    The caller's message list is never modified.
+    """
+
+    def __init__(self, agent, messages, prelude=()):
+        self.agent = agent
+        self.iteration = 0
+        self.context_report = None
+        self._num_init_messages = len(messages)
+        # The agent's prelude messages (e.g. a pre-routed tool call and its result) are part of the turn's response
+        self.messages = list(messages) + list(prelude)
+
+    def next_request(self):
+        """Returns the chat completion request for the next model call."""
+        self.iteration += 1
+        print("Iter: " + str(self.iteration))
+
+        # tool schemas and validators are compiled once when the agent is built
+        tool_schemas = self.agent.registry.schemas
+
+        print("Current agent: " + self.agent.name)
+
+        # Keep the prompt within the token budget; the history itself is left untouched
+        request_messages, self.context_report = context_budget.apply(self.agent.system_prompt(), self.messages, tool_schemas)
+
+        # Use this for local only, connect to Mistral Free API
+        # response = client.chat.complete(
+        #     model=MISTRAL_MODEL,
+        #     messages=[{"role": "system", "content": current_agent.instructions}]
+        #     + messages,
+        #     temperature=0.0,
+        #     tools = tool_schemas,
+        #     tool_choice = "auto",
+        # )
+        return dict(
+            model=MISTRAL_MODEL,
+            messages=request_messages,
+            temperature=0.0,
+            tools = tool_schemas,
+            tool_choice = "auto",
+        )
+
+    @contextlib.contextmanager
+    def llm_span(self, **attributes):
+        with span("llm", MISTRAL_MODEL, agent=self.agent.name, iteration=self.iteration, **attributes) as llm_span:
+            llm_span.set(context_tokens=self.context_report.final_tokens, context_saved_tokens=self.context_report.saved_tokens)
+            yield llm_span
+
+    def add_message(self, message):
+        """Appends an assistant message and returns the tool calls it makes."""
+        self.messages.append(message)
+
+        if message.content:  # print agent response
+            print(f"{self.agent.name}:", message.content)
+
+        return message.tool_calls or []
+
+    def add_tool_result(self, tool_call, result):
+        """Appends the result of a tool call, switching agents on a transfer, and returns the content."""
+        print("Tool call completed. Result:")
+        if isinstance(result, Agent):  # if agent transfer, update current agent
+            self.agent = result
+            result = (
+                f"Transfered to {self.agent.name}. Adopt persona immediately."
+            )
+
+        result_message = {
+            "role": "tool",
+            "tool_call_id": tool_call.id,
+            "name": tool_call.function.name,
+            "content": result,
+        }
+        print(result_message)
+        self.messages.append(result_message)
+        return result
+
+    def response(self):
+        return Response(agent=self.agent, messages=self.messages[self._num_init_messages:])
+
+
+def _prelude_events(prelude):
+    for message in prelude:
+        if message.get("role") == "tool":
+            yield {"type": "tool_result", "name": message["name"], "content": message["content"]}
+        for tool_call in message.get("tool_calls") or []:
+            yield {"type": "tool_call", "name": tool_call["function"]["name"], "arguments": tool_call["function"]["arguments"]}
+
+
+def iter_turn(agent, messages, stream=False, rate_limiter=None):
+    """
+    Runs one agent turn, yielding events as they happen:
+        {"type": "delta", "content": str}             content fragment of the current assistant message (stream only)
+        {"type": "message", "message": message}       assistant message completed
+        {"type": "tool_call", "name": str, "arguments": str}    raw JSON arguments
+        {"type": "tool_result", "name": str, "content": str}
+        {"type": "done", "response": Response}        turn finished
+
+    With stream=True the model's answer is streamed; either way completions are
+    served from the completion cache when possible. rate_limiter, when given, is
+    acquired before every model call.
+    """
+    with span("turn", agent.name, agent=agent.name):
+        prelude = agent.prelude_messages(messages)
+        turn = Turn(agent, messages, prelude)
+        yield from _prelude_events(prelude)
+
+        while True:
+            request = turn.next_request()
+
+            # Throttle model calls across concurrently running orders
+            if rate_limiter is not None:
+                rate_limiter.acquire()
+
+            if stream:
+                with turn.llm_span(stream=True) as llm_span:
+                    started = time.perf_counter()
+                    chunks = []
+                    for chunk in cached_completion_stream(
+                        get_client(), stream=True, stream_options={"include_usage": True}, **request
+                    ):
+                        chunks.append(chunk)
+                        # With include_usage the token counts arrive in a final chunk without choices
+                        if getattr(chunk, "usage", None):
+                            llm_span.record_usage(chunk.usage)
+                        if not chunk.choices or not chunk.choices[0].delta.content:
+                            continue
+                        if "time_to_first_token_seconds" not in llm_span.attributes:
+                            llm_span.set(time_to_first_token_seconds=round(time.perf_counter() - started, 6))
+                        yield {"type": "delta", "content": chunk.choices[0].delta.content}
+                    message = completion_from_chunks(chunks).choices[0].message
+            else:
+                with turn.llm_span() as llm_span:
+                    response = cached_completion(get_client(), **request)
+                    llm_span.record_usage(response.usage)
+                message = response.choices[0].message
+
+            tool_calls = turn.add_message(message)
+            yield {"type": "message", "message": message}
+            if not tool_calls:  # if finished handling tool calls, break
+                break
+
+            for tool_call in tool_calls:
+                yield {
+                    "type": "tool_call",
+                    "name": tool_call.function.name,
+                    "arguments": tool_call.function.arguments,
+                }
+                result = turn.add_tool_result(
+                    tool_call, execute_tool_call(tool_call, turn.agent.registry, turn.agent.name)
+                )
+                yield {"type": "tool_result", "name": tool_call.function.name, "content": result}
+
+        yield {"type": "done", "response": turn.response()}
+
+
+def run_turn(agent, messages, rate_limiter=None):
+    """Runs one agent turn without streaming and returns its Response."""
+    for event in iter_turn(agent, messages, rate_limiter=rate_limiter):
+        if event["type"] == "done":
+            return event["response"]
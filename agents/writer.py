@@ -0,0 +1,215 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+
+from agents.db import get_connection
+from agents.migrations import current_version, IDEMPOTENT_INSERT_VERSION
+from agents.order_cache import order_resolution_cache
+from agents.telemetry import metrics, span
+
+load_dotenv()
+
+# Write-behind settings for UFO_ORDER_RESOLUTION inserts
+RESOLUTION_WRITER_QUEUE_SIZE = int(os.getenv("RESOLUTION_WRITER_QUEUE_SIZE", "1000"))
+RESOLUTION_WRITER_BATCH_SIZE = int(os.getenv("RESOLUTION_WRITER_BATCH_SIZE", "100"))
+RESOLUTION_WRITER_FLUSH_INTERVAL = float(os.getenv("RESOLUTION_WRITER_FLUSH_INTERVAL", "1.0"))
+RESOLUTION_WRITER_SUBMIT_TIMEOUT = float(os.getenv("RESOLUTION_WRITER_SUBMIT_TIMEOUT", "5"))
+# Seconds before the schema version is read again while the idempotent insert migration is not applied
+RESOLUTION_WRITER_SCHEMA_CHECK_INTERVAL = float(os.getenv("RESOLUTION_WRITER_SCHEMA_CHECK_INTERVAL", "300"))
+
+RESOLUTION_COLUMNS = (
+    "ih_number",
+    "order_id",
+    "customer_order_id",
+    "integration_id",
+    "transaction_id",
+    "submitted_date",
+    "system",
+    "root_cause_analysis",
+    "action_taken",
+)
+
+INSERT_QUERY = f"INSERT INTO UFO_ORDER_RESOLUTION ({', '.join(RESOLUTION_COLUMNS)}) VALUES %s"
+
+
+class WriterQueueFullError(Exception):
+    """Raised when a resolution cannot be queued because the writer is saturated."""
+
+
+# Once the unique constraint exists, re-running an order updates its resolution instead of duplicating it
+UPSERT_QUERY = INSERT_QUERY + (
+    " ON CONFLICT (integration_id, transaction_id) DO UPDATE SET "
+    + ", ".join(
+        f"{column} = EXCLUDED.{column}"
+        for column in RESOLUTION_COLUMNS
+        if column not in ("integration_id", "transaction_id")
+    )
+)
+
+_idempotent_inserts = False
+_schema_checked_at = None
+
+
+def _use_upsert():
+    # Once applied the migration stays applied; until then the version is only re-read every check interval
+    global _idempotent_inserts, _schema_checked_at
+    now = time.monotonic()
+    if not _idempotent_inserts and (
+        _schema_checked_at is None or now - _schema_checked_at >= RESOLUTION_WRITER_SCHEMA_CHECK_INTERVAL
+    ):
+        _idempotent_inserts = current_version() >= IDEMPOTENT_INSERT_VERSION
+        _schema_checked_at = now
+    return _idempotent_inserts
+
+
+def insert_resolutions(rows):
+    """Inserts resolution rows with a single multi-row INSERT and one commit."""
+    query = INSERT_QUERY
+    if _use_upsert():
+        query = UPSERT_QUERY
+        # A single upsert cannot touch the same key twice; keep the latest row per order.
+        # Rows with a NULL key never conflict, so they all go through as they are
+        keyed = {}
+        unkeyed = []
+        for row in rows:
+            if row[3] is None or row[4] is None:
+                unkeyed.append(row)
+            else:
+                keyed[(row[3], row[4])] = row
+        rows = unkeyed + list(keyed.values())
+
+    with get_connection() as connection:
+        with span("db", "insert_resolutions", rows=len(rows), upsert=query is UPSERT_QUERY):
+            with connection.cursor() as cursor:
+                execute_values(cursor, query, rows, page_size=len(rows))
+            connection.commit()
+
+
+class ResolutionWriter:
+    """
+    Background group-commit writer for UFO_ORDER_RESOLUTION.
+
+    Rows are queued by submit() and flushed by a worker thread once
+    `batch_size` rows are waiting or `flush_interval` seconds have passed.
+    If a group insert fails, the rows are retried one by one so a single bad
+    row does not drop the rest; rows that still fail are kept in failures().
+    The queue is drained on interpreter shutdown.
+    """
+
+    def __init__(self, queue_size=RESOLUTION_WRITER_QUEUE_SIZE, batch_size=RESOLUTION_WRITER_BATCH_SIZE,
+                 flush_interval=RESOLUTION_WRITER_FLUSH_INTERVAL, insert=insert_resolutions):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._insert = insert
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._failures = deque(maxlen=1000)
+        self._stats = {"queued": 0, "written": 0, "failed": 0, "flushes": 0}
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="resolution-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, row, timeout=RESOLUTION_WRITER_SUBMIT_TIMEOUT):
+        """Queues one resolution row (in RESOLUTION_COLUMNS order) and returns immediately."""
+        self._ensure_started()
+        try:
+            self._queue.put(tuple(row), timeout=timeout)
+        except queue.Full:
+            raise WriterQueueFullError(
+                f"Resolution writer queue is full ({self._queue.maxsize} rows pending)"
+            )
+        with self._lock:
+            self._stats["queued"] += 1
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                self._flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _flush(self, batch):
+        try:
+            self._insert(batch)
+            written, failed = batch, []
+        except Exception as e:
+            print(f"Group insert of {len(batch)} resolutions failed, retrying row by row: {e}")
+            written, failed = [], []
+            for row in batch:
+                try:
+                    self._insert([row])
+                    written.append(row)
+                except Exception as row_error:
+                    print(f"Database error occurred: {row_error}")
+                    failed.append((row, str(row_error)))
+
+        # Cached lookups for the written orders are now stale
+        for row in written:
+            order_resolution_cache.invalidate(ih_number=row[0], customer_order_id=row[2])
+
+        with self._lock:
+            self._stats["flushes"] += 1
+            self._stats["written"] += len(written)
+            self._stats["failed"] += len(failed)
+            for row, error in failed:
+                self._failures.append({"row": dict(zip(RESOLUTION_COLUMNS, row)), "error": error, "failed_at": time.time()})
+
+    def flush(self):
+        """Blocks until every queued row has been written or recorded as failed."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self, timeout=30):
+        """Flushes the queue and stops the worker thread."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def failures(self, since=None):
+        """Returns the rows that could not be written, only those failed at or after `since` if given."""
+        with self._lock:
+            return [failure for failure in self._failures if since is None or failure["failed_at"] >= since]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["pending"] = self._queue.qsize()
+        return stats
+
+
+resolution_writer = ResolutionWriter()
+metrics.register_collector("ufo_resolution_writer", resolution_writer.stats)
+
+atexit.register(resolution_writer.close)
@@ -0,0 +1,51 @@
+# Compares two benchmark result files written by benchmarks.run:
+#
+#     python -m benchmarks.compare benchmarks/results/<old>.json benchmarks/results/<new>.json
+import argparse
+import json
+
+METRICS = [
+    ("turns/s", lambda r: r["turns_per_second"], True),
+    ("p50 ms", lambda r: r["iteration_latency_seconds"]["p50"] * 1000, False),
+    ("p95 ms", lambda r: r["iteration_latency_seconds"]["p95"] * 1000, False),
+    ("p99 ms", lambda r: r["iteration_latency_seconds"]["p99"] * 1000, False),
+    ("llm calls", lambda r: r["llm"]["calls"], False),
+    ("prompt chars", lambda r: r["llm"]["mean_prompt_chars"], False),
+    ("prefill/turn", lambda r: r["llm"].get("uncached_prompt_chars_per_turn", 0), False),
+    ("db s", lambda r: r["db"]["seconds"], False),
+    ("http s", lambda r: r["http"]["seconds"], False),
+    ("rss MB", lambda r: r["peak_rss_mb"], False),
+]
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    args = parser.parse_args()
+
+    baseline = load(args.baseline)
+    candidate = load(args.candidate)
+    print(f"baseline {baseline['commit']} ({baseline['timestamp']}) -> candidate {candidate['commit']} ({candidate['timestamp']})")
+
+    for name, result in candidate["scenarios"].items():
+        if name not in baseline["scenarios"]:
+            print(f"\n{name}: not in baseline")
+            continue
+        before = baseline["scenarios"][name]
+        print(f"\n{name}")
+        for label, metric, higher_is_better in METRICS:
+            old, new = metric(before), metric(result)
+            change = (new - old) / old * 100 if old else 0.0
+            better = change > 0 if higher_is_better else change < 0
+            marker = "" if abs(change) < 5 else (" better" if better else " worse")
+            print(f"  {label:13} {old:12.2f} {new:12.2f} {change:+8.1f}%{marker}")
+
+
+if __name__ == "__main__":
+    main()
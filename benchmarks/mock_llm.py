@@ -0,0 +1,227 @@
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.stub_splunk import ORDER_HEADER
+
+_IH_NUMBER = re.compile(r"\b\d{6,}\b")
+
+# Prefix caching is emulated like the model server does it: the prompt is cut into fixed-size
+# blocks chained by hash, and leading blocks seen in an earlier request need no prefill
+PREFIX_BLOCK_CHARS = 64
+
+# Scripted conversations replayed by the mock model. Each step is the reply to one
+# model call of a turn: either tool calls or final content. "{FIELD}" placeholders
+# in arguments are filled from the order row in the user message.
+SCRIPTS = {
+    "manager": [
+        {"tool_calls": [{"name": "query_order_resolution", "arguments": {"id_type": "IH_NUMBER", "id_list": ["{IH_NUMBER}"]}}]},
+        {"content": "Order {IH_NUMBER} failed because of an internal server error in NBP. Action taken: RETRY: Need to retry from UFO. Would you like me to retry the order?"},
+    ],
+    "troubleshooting": [
+        {"tool_calls": [{"name": "find_nbp_log", "arguments": {"integration_id": "{INTEGRATION_ID}"}}]},
+        # Skipped when the SOP catalog is already part of the system prompt
+        {"tool_calls": [{"name": "lookup_sop", "arguments": {"error_code": "CM-GEN01"}}], "unless_system": "sop catalog:"},
+        {"tool_calls": [{"name": "update_order_resolution", "arguments": {
+            "ih_number": "{IH_NUMBER}", "order_id": "{ORDER_ID}", "customer_order_id": "{CUSTOMER_ORDER_ID}",
+            "integration_id": "{INTEGRATION_ID}", "transaction_id": "{TRANSACTION_ID}",
+            "submitted_date": "{SUBMITTED_DATE}", "system": "{SRC_SYSTEM}",
+            "root_cause_analysis": "Internal server error from NBP", "action_taken": "RETRY: Need to retry from UFO",
+        }}]},
+        {"content": "1. Found the NBP log\n2. NBP error CM-GEN01\n3. SOP: Internal Server Error\n4. Updated the resolution table"},
+    ],
+}
+
+
+def _order_fields(messages):
+    for message in reversed(messages):
+        if message.get("role") != "user":
+            continue
+        content = str(message.get("content") or "")
+        for line in content.splitlines():
+            values = line.split(",")
+            if len(values) == len(ORDER_HEADER) and values != ORDER_HEADER:
+                return dict(zip(ORDER_HEADER, values))
+        # Manager questions: use the first all-digit token as the IH number
+        ih_number = _IH_NUMBER.search(content)
+        if ih_number:
+            return {"IH_NUMBER": ih_number.group(0)}
+    return {}
+
+
+def _fill(value, fields):
+    if isinstance(value, str):
+        for name, field in fields.items():
+            value = value.replace("{" + name + "}", field)
+        return value
+    if isinstance(value, list):
+        return [_fill(item, fields) for item in value]
+    if isinstance(value, dict):
+        return {key: _fill(item, fields) for key, item in value.items()}
+    return value
+
+
+class MockLLMServer:
+    """
+    OpenAI-compatible /v1/chat/completions server replaying scripted turns.
+
+    The script is picked by the agent's system prompt (troubleshooting or
+    manager) and the step from the number of assistant messages since the last user
+    message, so the server is stateless and safe for concurrent conversations.
+    Every call sleeps `latency` seconds (plus up to `jitter`) before replying,
+    and records the prompt size and how much of it a prefix cache would have
+    served, for prefill comparisons.
+    """
+
+    def __init__(self, scripts=SCRIPTS, latency=0.05, jitter=0.0, host="127.0.0.1", port=0):
+        self.scripts = scripts
+        self.latency = latency
+        self.jitter = jitter
+        self._lock = threading.Lock()
+        self.requests = []
+        self._prefix_blocks = set()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _cached_prefix_chars(self, prompt):
+        """Returns the length of the leading blocks of `prompt` that an earlier request already prefilled."""
+        blocks = []
+        parent = None
+        for start in range(0, len(prompt) - PREFIX_BLOCK_CHARS + 1, PREFIX_BLOCK_CHARS):
+            parent = hash((parent, prompt[start:start + PREFIX_BLOCK_CHARS]))
+            blocks.append(parent)
+        with self._lock:
+            cached = 0
+            for block in blocks:
+                if block not in self._prefix_blocks:
+                    break
+                cached += PREFIX_BLOCK_CHARS
+            self._prefix_blocks.update(blocks)
+        return cached
+
+    def _reply(self, request):
+        messages = request.get("messages", [])
+        last_user = max((i for i, m in enumerate(messages) if m.get("role") == "user"), default=0)
+        step_index = sum(1 for m in messages[last_user:] if m.get("role") == "assistant")
+        system = str(messages[0].get("content") or "").lower() if messages else ""
+        script = self.scripts["troubleshooting" if "troubleshooting" in system else "manager"]
+        script = [step for step in script if not step.get("unless_system") or step["unless_system"] not in system]
+        step = script[min(step_index, len(script) - 1)]
+        fields = _order_fields(messages)
+
+        # Rendered the way chat templates lay out a prompt: system message, tools, then the conversation
+        prefix = json.dumps(messages[:1]) + json.dumps(request.get("tools", []))
+        prompt = prefix + "".join(json.dumps(message) for message in messages[1:])
+        record = {
+            "messages": len(messages),
+            "prompt_chars": len(prompt),
+            "cached_prompt_chars": self._cached_prefix_chars(prompt),
+            "prefix": prefix,
+        }
+        with self._lock:
+            self.requests.append(record)
+
+        message = {"role": "assistant", "content": None}
+        if "tool_calls" in step:
+            message["tool_calls"] = [
+                {
+                    "id": "call_" + uuid.uuid4().hex[:9],
+                    "type": "function",
+                    "function": {"name": call["name"], "arguments": json.dumps(_fill(call["arguments"], fields))},
+                }
+                for call in step["tool_calls"]
+            ]
+        else:
+            message["content"] = _fill(step["content"], fields)
+        return message, record
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; without this, Nagle plus delayed ACKs add ~40ms per reply
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                request = json.loads(body)
+                time.sleep(mock.latency + random.uniform(0, mock.jitter))
+                message, record = mock._reply(request)
+                prompt_tokens = len(body) // 4
+                cached_tokens = record["cached_prompt_chars"] // 4
+                completion_tokens = len(json.dumps(message)) // 4
+
+                if request.get("stream"):
+                    self._stream(request, message)
+                    return
+
+                payload = json.dumps({
+                    "id": "chatcmpl-" + uuid.uuid4().hex,
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model") or "mock",
+                    "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if message.get("tool_calls") else "stop"}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens,
+                              "prompt_tokens_details": {"cached_tokens": cached_tokens}},
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _stream(self, request, message):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                completion_id = "chatcmpl-" + uuid.uuid4().hex
+
+                def send(delta, finish_reason=None):
+                    chunk = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": request.get("model") or "mock",
+                        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.flush()
+
+                send({"role": "assistant"})
+                for index, tool_call in enumerate(message.get("tool_calls") or []):
+                    arguments = tool_call["function"]["arguments"]
+                    middle = len(arguments) // 2
+                    send({"tool_calls": [{"index": index, "id": tool_call["id"], "type": "function", "function": {"name": tool_call["function"]["name"], "arguments": arguments[:middle]}}]})
+                    send({"tool_calls": [{"index": index, "function": {"arguments": arguments[middle:]}}]})
+                if message.get("content"):
+                    for word in message["content"].split(" "):
+                        send({"content": word + " "})
+                send({}, "tool_calls" if message.get("tool_calls") else "stop")
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+
+        return Handler
@@ -0,0 +1,289 @@
+# Offline benchmark suite for the UFO agents.
+#
+# Runs the agent loops against a local OpenAI-compatible mock model, a stub
+# splunk endpoint and a SQLite stand-in for PostgreSQL, so results only depend
+# on this code and the configured mock latencies:
+#
+#     python -m benchmarks.run                                  # all scenarios
+#     python -m benchmarks.run --scenario troubleshooting_llm --orders 500 --concurrency 16
+#     python -m benchmarks.compare benchmarks/results/<old>.json benchmarks/results/<new>.json
+#
+# Each run writes benchmarks/results/<commit>.json so runs can be compared across commits.
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from benchmarks.mock_llm import MockLLMServer
+from benchmarks.sqlite_db import SqliteDatabase
+from benchmarks.stub_splunk import StubSplunkServer, make_orders
+
+SCENARIOS = ["manager_turn", "manager_stream", "troubleshooting_fast", "troubleshooting_llm"]
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class Recorder:
+    """
+    Collects per-iteration latency (one model call plus the tools it triggered)
+    and the time spent in model calls and splunk requests.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.iterations = []
+            self.llm_seconds = 0.0
+            self.llm_calls = 0
+            self.http_seconds = 0.0
+            self.http_requests = 0
+            self.first_token = []
+
+    def turn_started(self):
+        self._local.started = time.perf_counter()
+
+    def iteration_started(self):
+        now = time.perf_counter()
+        previous = getattr(self._local, "started", None)
+        if previous is not None:
+            with self._lock:
+                self.iterations.append(now - previous)
+        self._local.started = now
+
+    def turn_finished(self):
+        previous = getattr(self._local, "started", None)
+        if previous is not None:
+            with self._lock:
+                self.iterations.append(time.perf_counter() - previous)
+        self._local.started = None
+
+    def timed(self, func, kind):
+        recorder = self
+
+        def wrapper(*args, **kwargs):
+            if kind == "llm":
+                recorder.iteration_started()
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                with recorder._lock:
+                    if kind == "llm":
+                        recorder.llm_seconds += elapsed
+                        recorder.llm_calls += 1
+                    else:
+                        recorder.http_seconds += elapsed
+                        recorder.http_requests += 1
+
+        return wrapper
+
+
+def configure_environment(args, mock, splunk, workdir):
+    os.environ.update({
+        "MISTRAL_API_KEY": "mock",
+        "MISTRAL_MODEL": "mock-model",
+        "MISTRAL_BASE_URL": mock.base_url,
+        "SPLUNK_URL": splunk.url,
+        "SPLUNK_BACKOFF_BASE": "0.01",
+        "LLM_CACHE_ENABLED": "false",
+        "NBP_LOG_CACHE_ENABLED": "true" if args.log_cache else "false",
+        "NBP_LOG_CACHE_PATH": os.path.join(workdir, "nbp_log_cache.sqlite3"),
+        "RESOLUTION_WRITER_FLUSH_INTERVAL": "0.05",
+        "BATCH_MAX_WORKERS": str(args.concurrency),
+        "LLM_RATE_LIMIT_PER_SECOND": "100000",
+        "LLM_RATE_LIMIT_BURST": str(max(args.concurrency, 1)),
+    })
+
+
+def run_scenario(name, turn, units, recorder, database, splunk, mock, concurrency, trace_memory=False):
+    recorder.reset()
+    database.reset_stats()
+    splunk_searches = splunk.searches
+    mock_requests = len(mock.requests)
+
+    # tracemalloc slows every allocation, so the Python heap peak is only measured on request
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    turn(units, concurrency)
+    duration = time.perf_counter() - start
+    peak = None
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    requests = mock.requests[mock_requests:]
+    prompts = [request["prompt_chars"] for request in requests]
+    uncached = [request["prompt_chars"] - request["cached_prompt_chars"] for request in requests]
+    return {
+        "units": units,
+        "duration_seconds": duration,
+        "turns_per_second": units / duration if duration else 0.0,
+        "iteration_latency_seconds": {
+            "count": len(recorder.iterations),
+            "p50": percentile(recorder.iterations, 0.50),
+            "p95": percentile(recorder.iterations, 0.95),
+            "p99": percentile(recorder.iterations, 0.99),
+        },
+        "llm": {"calls": recorder.llm_calls, "seconds": recorder.llm_seconds,
+                "mean_prompt_chars": sum(prompts) / len(prompts) if prompts else 0,
+                # Prefill the server could not serve from its prefix cache
+                "mean_uncached_prompt_chars": sum(uncached) / len(uncached) if uncached else 0,
+                "uncached_prompt_chars_per_turn": sum(uncached) / units if units else 0,
+                "prefix_cache_hit_rate": 1 - sum(uncached) / sum(prompts) if prompts else 0.0,
+                # Every call of a scenario must share one byte-identical system prompt and tool list
+                "distinct_prefixes": len({request["prefix"] for request in requests})},
+        "db": {"queries": database.queries, "seconds": database.seconds},
+        "http": {"requests": recorder.http_requests, "seconds": recorder.http_seconds,
+                 "splunk_searches": splunk.searches - splunk_searches},
+        "first_token_seconds_p50": percentile(recorder.first_token, 0.50),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "peak_python_memory_mb": peak / (1024 * 1024) if peak is not None else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the UFO agents.")
+    parser.add_argument("--scenario", choices=SCENARIOS + ["all"], default="all")
+    parser.add_argument("--turns", type=int, default=50, help="manager turns per manager scenario")
+    parser.add_argument("--orders", type=int, default=200, help="orders per troubleshooting scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="mock model seconds per call")
+    parser.add_argument("--llm-jitter", type=float, default=0.0)
+    parser.add_argument("--splunk-latency", type=float, default=0.02, help="stub splunk seconds per search")
+    parser.add_argument("--log-cache", action="store_true", help="keep the NBP log cache enabled")
+    parser.add_argument("--trace-memory", action="store_true", help="measure the Python heap peak per scenario (slower)")
+    parser.add_argument("--output", default=os.path.join("benchmarks", "results"))
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="ufo-bench-")
+    mock = MockLLMServer(latency=args.llm_latency, jitter=args.llm_jitter).start()
+    splunk = StubSplunkServer(latency=args.splunk_latency).start()
+    configure_environment(args, mock, splunk, workdir)
+
+    # The stand-in database must be installed before the agent modules import get_connection
+    database = SqliteDatabase(os.path.join(workdir, "ufo.sqlite3")).install()
+    recorder = Recorder()
+
+    import agents.manager as manager
+    import agents.splunk
+    import agents.writer
+    from agents.core import get_client
+
+    agents.writer.resolution_writer._insert = database.insert_resolutions
+    client = get_client()
+    client.chat.completions.create = recorder.timed(client.chat.completions.create, "llm")
+    session = agents.splunk.get_splunk_client().session
+    session.post = recorder.timed(session.post, "http")
+
+    def manager_turn(units, concurrency):
+        for index in range(units):
+            messages = [{"role": "user", "content": f"What happened to order {190000100000 + index}?"}]
+            manager.run_full_turn(manager.manager_agent, messages)
+            recorder.turn_finished()
+
+    def manager_stream(units, concurrency):
+        for index in range(units):
+            messages = [{"role": "user", "content": f"What happened to order {190000100000 + index}?"}]
+            start = time.perf_counter()
+            first = None
+            for event in manager.run_full_turn_stream(manager.manager_agent, messages):
+                if event["type"] == "delta" and first is None:
+                    first = time.perf_counter() - start
+            if first is not None:
+                recorder.first_token.append(first)
+            recorder.turn_finished()
+
+    def troubleshooting(fast_path):
+        def run(units, concurrency):
+            import agents.troubleshooting as troubleshooting
+            from agents.batch import run_batch
+
+            troubleshooting.TROUBLESHOOT_FAST_PATH = fast_path
+
+            def process(order):
+                recorder.turn_started()
+                try:
+                    return troubleshooting.troubleshoot_order(order)
+                finally:
+                    recorder.turn_finished()
+
+            orders = make_orders(units, seed=int(fast_path))
+            report = run_batch(orders, process, max_workers=concurrency)
+            agents.writer.resolution_writer.flush()
+            if report.failed:
+                print(report.summary(), file=sys.stderr)
+
+        return run
+
+    turns = {
+        "manager_turn": (manager_turn, args.turns),
+        "manager_stream": (manager_stream, args.turns),
+        "troubleshooting_fast": (troubleshooting(True), args.orders),
+        "troubleshooting_llm": (troubleshooting(False), args.orders),
+    }
+    selected = SCENARIOS if args.scenario == "all" else [args.scenario]
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": vars(args),
+        "scenarios": {},
+    }
+    for name in selected:
+        turn, units = turns[name]
+        print(f"Running {name} ({units} units)...", file=sys.stderr)
+        results["scenarios"][name] = run_scenario(
+            name, turn, units, recorder, database, splunk, mock, args.concurrency, args.trace_memory
+        )
+
+    mock.stop()
+    splunk.stop()
+
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"{results['commit']}.json")
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"{'scenario':22} {'turns/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'llm s':>7} {'db s':>7} {'http s':>7} {'rss MB':>8} {'prefill/turn':>12}")
+    for name, result in results["scenarios"].items():
+        latency = result["iteration_latency_seconds"]
+        print(
+            f"{name:22} {result['turns_per_second']:9.2f} {latency['p50'] * 1000:8.1f} {latency['p95'] * 1000:8.1f} "
+            f"{latency['p99'] * 1000:8.1f} {result['llm']['seconds']:7.2f} {result['db']['seconds']:7.2f} "
+            f"{result['http']['seconds']:7.2f} {result['peak_rss_mb']:8.1f} {result['llm']['uncached_prompt_chars_per_turn']:12.0f}"
+        )
+    print(f"Results written to {path}")
+
+    unstable = [name for name, result in results["scenarios"].items() if result["llm"]["distinct_prefixes"] > 1]
+    for name in unstable:
+        print(f"{name}: the static prompt prefix changed between model calls "
+              f"({results['scenarios'][name]['llm']['distinct_prefixes']} variants)", file=sys.stderr)
+    return 1 if unstable else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
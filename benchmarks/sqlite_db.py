@@ -0,0 +1,203 @@
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_PLACEHOLDER = re.compile(r"%s")
+# PostgreSQL array binding; SQLite gets the array as JSON and expands it with json_each
+_ANY_PLACEHOLDER = re.compile(r"=\s*ANY\(%s\)", re.IGNORECASE)
+# PostgreSQL aggregate functions used by the summary tool, emulated with SQLite user functions
+_ARRAY_AGG_SLICE = re.compile(r"\(array_agg\((\w+) ORDER BY \w+\)\)\[1:%s\]", re.IGNORECASE)
+_ARRAY_COLUMNS = {"example_ids"}
+
+
+class _ArrayAggLimit:
+    def __init__(self):
+        self.values = []
+        self.limit = None
+
+    def step(self, value, limit):
+        self.values.append(value)
+        self.limit = limit
+
+    def finalize(self):
+        return json.dumps(sorted(self.values)[:self.limit]) if self.values else None
+
+
+def _date_trunc(unit, value):
+    if value is None:
+        return None
+    day = datetime.fromisoformat(str(value)).date()
+    if unit == "week":
+        day -= timedelta(days=day.weekday())
+    elif unit == "month":
+        day = day.replace(day=1)
+    return f"{day.isoformat()} 00:00:00"
+
+
+def _bind(params):
+    return tuple(json.dumps(list(value)) if isinstance(value, (list, tuple)) else value for value in params or ())
+
+
+class _Cursor:
+    itersize = 2000
+
+    def __init__(self, database, cursor, dict_rows):
+        self._database = database
+        self._cursor = cursor
+        self._dict_rows = dict_rows
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def execute(self, query, params=None):
+        start = time.perf_counter()
+        try:
+            self._cursor.execute(self._database.translate(query), _bind(params))
+        finally:
+            self._database.record(time.perf_counter() - start)
+
+    def executemany(self, query, rows):
+        start = time.perf_counter()
+        try:
+            self._cursor.executemany(self._database.translate(query), [tuple(row) for row in rows])
+        finally:
+            self._database.record(time.perf_counter() - start)
+
+    def _row(self, row):
+        if row is None or not self._dict_rows:
+            return row
+        row = dict(zip([column[0] for column in self._cursor.description], row))
+        for column in _ARRAY_COLUMNS & row.keys():
+            if isinstance(row[column], str):
+                row[column] = json.loads(row[column])
+        return row
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchmany(self, size):
+        return [self._row(row) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def __iter__(self):
+        while True:
+            rows = self.fetchmany(self.itersize)
+            if not rows:
+                return
+            yield from rows
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _Connection:
+    closed = 0
+
+    def __init__(self, database, connection):
+        self._database = database
+        self._connection = connection
+
+    def cursor(self, cursor_factory=None, name=None):
+        return _Cursor(self._database, self._connection.cursor(), dict_rows=cursor_factory is not None)
+
+    def commit(self):
+        start = time.perf_counter()
+        self._connection.commit()
+        self._database.record(time.perf_counter() - start, query=False)
+
+    def rollback(self):
+        self._connection.rollback()
+
+
+class SqliteDatabase:
+    """
+    SQLite stand-in for the UFO PostgreSQL database.
+
+    Seeds ufo_sop and ufo_order_resolution from the repository DDL files and
+    exposes a get_connection() with the psycopg2 cursor surface the agent
+    tools use (%s placeholders, cursor_factory for dict rows). Time spent in
+    queries and commits is accumulated for the benchmark report.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(tempfile.mkdtemp(prefix="ufo-bench-"), "ufo.sqlite3")
+        self._lock = threading.Lock()
+        self.seconds = 0.0
+        self.queries = 0
+
+        connection = sqlite3.connect(self.path)
+        connection.execute("PRAGMA journal_mode=WAL")
+        for ddl in ("ddl_ufo_sop_table.txt", "ddl_ufo_resolution_table.txt"):
+            with open(os.path.join(ROOT, ddl)) as f:
+                connection.executescript(f.read())
+        connection.commit()
+        connection.close()
+
+    def translate(self, query):
+        query = _ANY_PLACEHOLDER.sub("IN (SELECT value FROM json_each(?))", query)
+        query = _ARRAY_AGG_SLICE.sub(r"array_agg_limit(\1, ?)", query)
+        return _PLACEHOLDER.sub("?", query).replace("%%", "%")
+
+    def record(self, seconds, query=True):
+        with self._lock:
+            self.seconds += seconds
+            self.queries += int(query)
+
+    def reset_stats(self):
+        with self._lock:
+            self.seconds = 0.0
+            self.queries = 0
+
+    @contextmanager
+    def get_connection(self):
+        connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        connection.create_aggregate("array_agg_limit", 2, _ArrayAggLimit)
+        connection.create_function("date_trunc", 2, _date_trunc)
+        try:
+            yield _Connection(self, connection)
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+
+    def insert_resolutions(self, rows):
+        """Replacement for the resolution writer's group insert (execute_values is psycopg2-only)."""
+        from agents.writer import RESOLUTION_COLUMNS
+
+        with self.get_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f"INSERT INTO ufo_order_resolution ({', '.join(RESOLUTION_COLUMNS)}) "
+                    f"VALUES ({', '.join(['%s'] * len(RESOLUTION_COLUMNS))})",
+                    rows,
+                )
+            connection.commit()
+
+    def install(self):
+        """Routes agents.db.get_connection to this database; call before importing the agent modules."""
+        import agents.db
+
+        agents.db.get_connection = self.get_connection
+        return self
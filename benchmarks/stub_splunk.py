@@ -0,0 +1,111 @@
+import json
+import random
+import re
+import string
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ORDER_HEADER = "IH_NUMBER,ORDER_ID,ORDER_TYPE,REASON_CODE,CUSTOMER_ORDER_ID,INTEGRATION_ID,TRANSACTION_ID,ORDER_STATUS,SUBMITTED_DATE,STEP_STATUS,FO_MSG,SRC_SYSTEM,STATUS".split(",")
+
+NBP_LOG_FIELD_COUNT = 40
+NBP_ERROR_CODE_POSITION = 35
+
+_ID_PATTERN = re.compile(r"[A-Z0-9]{25}")
+
+
+def make_orders(count, seed=0):
+    """Synthetic failed orders in the order_header format with unique integration IDs."""
+    rng = random.Random(seed)
+    orders = []
+    for index in range(count):
+        integration_id = "".join(rng.choice(string.ascii_uppercase + string.digits) for _ in range(25))
+        orders.append(",".join([
+            str(190000100000 + index),
+            str(12000000 + index),
+            "MO",
+            "CREQ",
+            f"MOi1250120{index:015d}",
+            integration_id,
+            f"s0187{index:038d}",
+            "Failed",
+            "1/20/2025 22:00",
+            "Failed",
+            "Internal Server Error",
+            "NBP",
+            "OPEN",
+        ]))
+    return orders
+
+
+def make_nbp_log(integration_id, error_code="CM-GEN01"):
+    fields = [f"field{position}" for position in range(1, NBP_LOG_FIELD_COUNT + 1)]
+    fields[0] = "2025-01-20 22:00:00.123"
+    fields[1] = integration_id
+    fields[NBP_ERROR_CODE_POSITION - 1] = error_code
+    fields[NBP_ERROR_CODE_POSITION] = "Internal Server Error"
+    return "|".join(fields)
+
+
+class StubSplunkServer:
+    """
+    Stand-in for the splunk query API's /search endpoint.
+
+    Answers both single-ID and OR'd batch searches with one synthetic NBP log
+    per integration ID found in the search term, after `latency` seconds.
+    IDs listed in `missing` have no log; `error_codes` overrides the NBP error
+    per ID (default CM-GEN01).
+    """
+
+    def __init__(self, latency=0.02, missing=(), error_codes=None, host="127.0.0.1", port=0):
+        self.latency = latency
+        self.missing = set(missing)
+        self.error_codes = error_codes or {}
+        self._lock = threading.Lock()
+        self.searches = 0
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/search"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; without this, Nagle plus delayed ACKs add ~40ms per reply
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                time.sleep(stub.latency)
+                with stub._lock:
+                    stub.searches += 1
+                results = [
+                    {"_raw": make_nbp_log(integration_id, stub.error_codes.get(integration_id, "CM-GEN01"))}
+                    for integration_id in _ID_PATTERN.findall(request.get("search_term", ""))
+                    if integration_id not in stub.missing
+                ]
+                payload = json.dumps({"results": results}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
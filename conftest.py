@@ -0,0 +1,30 @@
+import sys
+
+import pytest
+
+import agents.db
+from benchmarks.sqlite_db import SqliteDatabase
+
+
+@pytest.fixture
+def database(monkeypatch, tmp_path):
+    """
+    The SQLite stand-in for the UFO database, seeded from the repository DDL files.
+
+    Replaces get_connection in agents.db and in every agent module that imported it,
+    for the duration of the test, and starts from empty SOP and order caches.
+    """
+    from agents.order_cache import order_resolution_cache
+    from agents.sop import sop_catalog
+
+    db = SqliteDatabase(path=str(tmp_path / "ufo.sqlite3"))
+    original = agents.db.get_connection
+    for name, module in list(sys.modules.items()):
+        if name.startswith("agents.") and getattr(module, "get_connection", None) is original:
+            monkeypatch.setattr(module, "get_connection", db.get_connection)
+
+    sop_catalog.invalidate()
+    order_resolution_cache.clear()
+    yield db
+    sop_catalog.invalidate()
+    order_resolution_cache.clear()
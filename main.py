@@ -1,13 +1,42 @@
 import streamlit as st
 import json
 import agents.manager as ag_manager
-import time
+import agents.migrations as ag_migrations
+import agents.telemetry as ag_telemetry
+import agents.troubleshooting as ag_troubleshooting
+import agents.jobs as ag_jobs
+import os
+import uuid
 
 # App title
 st.set_page_config(page_title="UFO Order Manager Agent")
 
 assistant_image_url = "https://upload.wikimedia.org/wikipedia/commons/b/bc/Telkomsel_2021_icon.svg"
 
+# Chat history rendering: the latest messages are always shown, older ones a page at a time on request,
+# so a rerun costs the same however long the conversation gets
+HISTORY_RECENT_MESSAGES = 20
+HISTORY_PAGE_SIZE = 20
+
+# Agent turns and troubleshooting batches run as background jobs; the UI polls them at these intervals
+TURN_POLL_SECONDS = 0.5
+BATCH_POLL_SECONDS = 2
+
+# Bring the UFO tables up to the latest schema version once per server process
+@st.cache_resource
+def apply_schema_migrations():
+    return ag_migrations.apply_migrations()
+
+if ag_migrations.DB_AUTO_MIGRATE:
+    apply_schema_migrations()
+
+# Prometheus endpoint for the agent spans, started once per server process
+@st.cache_resource
+def start_metrics_server():
+    return ag_telemetry.start_metrics_server()
+
+start_metrics_server()
+
 # Store LLM generated responses
 if "messages" not in st.session_state.keys():
     st.session_state.messages = [{"role": "assistant", "content": "Hello, how may I assist you today with UFO related orders?"}]
@@ -70,62 +99,180 @@ if 'messages' not in st.session_state:
 if 'last_user_message' not in st.session_state:
     st.session_state.last_user_message = ''
 
+if 'history_pages_shown' not in st.session_state:
+    st.session_state.history_pages_shown = 0
+
+# Jobs are limited per user; each browser session counts as one user
+if 'user_id' not in st.session_state:
+    st.session_state.user_id = uuid.uuid4().hex
+
+if 'active_job' not in st.session_state:
+    st.session_state.active_job = None
+
+# Parsed JSON and chart payloads are cached, so reruns do not parse or reload them again
+@st.cache_data(show_spinner=False, max_entries=500)
+def load_json_payload(content):
+    if isinstance(content, str):
+        try:
+            return json.loads(content)
+        except ValueError:
+            return content
+    return content
+
+@st.cache_data(show_spinner=False, max_entries=100)
+def load_chart_payload(content):
+    if isinstance(content, str) and os.path.isfile(content):
+        with open(content, "rb") as f:
+            return f.read()
+    return content
+
+def render_message(message):
+    if message["role"] == "user":
+        with st.chat_message("user"):
+            st.markdown(message["content"])
+    elif message["role"] == "assistant":
+        with st.chat_message("assistant", avatar=assistant_image_url):
+            st.markdown(message["content"], unsafe_allow_html=True)
+    elif message["role"] == "json":
+        with st.chat_message("assistant", avatar=assistant_image_url):
+            st.json(load_json_payload(message["content"]), expanded=2)
+    elif message["role"] == "chart":
+        with st.chat_message("assistant", avatar=assistant_image_url):
+            st.image(load_chart_payload(message["content"]), use_container_width=True)
+
+def show_earlier_page():
+    st.session_state.history_pages_shown += 1
+
+# Runs as a fragment: paging through earlier messages reruns only this block, not the whole app
+@st.fragment
+def render_earlier_messages(earlier):
+    shown = min(len(earlier), st.session_state.history_pages_shown * HISTORY_PAGE_SIZE)
+    hidden = len(earlier) - shown
+    if hidden:
+        st.button(
+            f"Show {min(HISTORY_PAGE_SIZE, hidden)} earlier messages ({hidden} hidden)",
+            on_click=show_earlier_page,
+        )
+    for message in earlier[hidden:]:
+        render_message(message)
+
 # Display previous messages
+history = [message for message in st.session_state.messages if message["content"]]
+earlier, recent = history[:-HISTORY_RECENT_MESSAGES], history[-HISTORY_RECENT_MESSAGES:]
+if earlier:
+    render_earlier_messages(earlier)
+for message in recent:
+    render_message(message)
 
-for message in st.session_state.messages:
-    #print(message)
-    if message["content"]:
-        if message["role"] == "user":
-            with st.chat_message("user"):
-                st.markdown(message["content"])
-        elif message["role"] == "assistant":
-            with st.chat_message("assistant", avatar=assistant_image_url):
-                st.markdown(message["content"], unsafe_allow_html=True)
-        elif message["role"] == "json":
+
+# Replays the events of the running agent turn; once it finishes, moves its messages into the history
+@st.fragment(run_every=TURN_POLL_SECONDS)
+def render_active_job():
+    job_id = st.session_state.active_job
+    if job_id is None:
+        return
+    try:
+        status = ag_jobs.job_queue.status(job_id)
+        events = ag_jobs.job_queue.events(job_id)
+    except ag_jobs.JobNotFoundError:
+        st.session_state.active_job = None
+        st.rerun()
+
+    completed = []
+    streamed = ""
+    caption = "Thinking....."
+    for event in events:
+        if event["type"] == "delta":
+            streamed += event["content"]
+        elif event["type"] == "message":
+            # Close the current bubble; the next assistant message gets its own
+            if streamed:
+                completed.append(streamed)
+            streamed = ""
+        elif event["type"] == "tool_call":
+            caption = f"Running {event['name']}....."
+
+    if not status.finished:
+        for content in completed:
             with st.chat_message("assistant", avatar=assistant_image_url):
-                st.json(message["content"], expanded=2)
-        elif message["role"] == "chart":
+                st.markdown(content, unsafe_allow_html=True)
+        if streamed:
             with st.chat_message("assistant", avatar=assistant_image_url):
-                st.image(message["content"],use_container_width=True)
-                time.sleep(3)
+                st.markdown(streamed + "▌", unsafe_allow_html=True)
+        st.caption(caption)
+        st.button("Cancel", on_click=ag_jobs.job_queue.cancel, args=(job_id,))
+        return
+
+    if streamed:
+        completed.append(streamed)
+    st.session_state.messages.extend({"role": "assistant", "content": content} for content in completed)
+    if status.state == ag_jobs.SUCCEEDED:
+        st.session_state.agent = ag_jobs.job_queue.get(job_id).result.agent
+    elif status.state == ag_jobs.FAILED:
+        st.session_state.messages.append({"role": "assistant", "content": f"Sorry, something went wrong: {status.error}"})
+    st.session_state.active_job = None
+    st.rerun()
 
+# Lists this user's troubleshooting batches with their progress
+@st.fragment(run_every=BATCH_POLL_SECONDS)
+def render_batch_jobs():
+    for status in ag_jobs.job_queue.jobs(st.session_state.user_id):
+        if status.kind != "batch":
+            continue
+        st.progress(
+            status.progress / status.total if status.total else 1.0,
+            text=f"{status.progress}/{status.total} orders, {status.state}",
+        )
+        if not status.finished:
+            st.button("Cancel", key=f"cancel-{status.id}", on_click=ag_jobs.job_queue.cancel, args=(status.id,))
+            continue
+        results = [event["result"] for event in ag_jobs.job_queue.events(status.id)]
+        st.download_button(
+            "Download results",
+            data="\n".join(result.model_dump_json() for result in results),
+            file_name=f"troubleshooting-{status.id}.jsonl",
+            key=f"download-{status.id}",
+        )
+
+with st.sidebar:
+    st.subheader("Troubleshoot orders")
+    uploaded = st.file_uploader("Orders CSV in the order_header format", type=["csv", "txt"])
+    if uploaded is not None and st.button("Start troubleshooting"):
+        orders = ag_troubleshooting.read_orders(uploaded.getvalue().decode("utf-8").splitlines())
+        try:
+            ag_jobs.job_queue.submit_batch(st.session_state.user_id, orders)
+        except ag_jobs.JobLimitError as e:
+            st.warning(str(e))
+    render_batch_jobs()
 
 # Get user input
-user_message = st.chat_input("Type your message")
+user_message = st.chat_input("Type your message", disabled=st.session_state.active_job is not None)
 
-if user_message and user_message != st.session_state.last_user_message:
+if user_message and st.session_state.active_job is not None:
+    # Only one turn at a time: a second job would race the first and its answer would be lost
+    st.warning("Please wait for the current answer before sending another message.")
 
-    # Update last_user_message
-    st.session_state.last_user_message = user_message
+elif user_message and user_message != st.session_state.last_user_message:
 
-    # Add user message to messages
-    st.session_state.messages.append({"role": "user", "content": user_message})
-    messages = st.session_state.messages.copy()
+    user_turn = {"role": "user", "content": user_message}
+    messages = st.session_state.messages + [user_turn]
     with st.chat_message("user"):
         st.markdown(user_message)
 
-    # Run assistant response
-    with st.spinner("Thinking.....", show_time=True):
-        print("Executing Agent: " + st.session_state.agent.name)
-        response = ag_manager.run_full_turn(st.session_state.agent, messages)
-        st.session_state.agent = response.agent
-        print(response.agent)
-        print(response.messages)
-        # Display new messages
-        for message in response.messages:
-            print(message)
-            if isinstance(message, dict):
-                continue
-            else:
-                if message.content:
-                    if message.role == "assistant":
-                        with st.chat_message("assistant", avatar=assistant_image_url):
-                            st.markdown(message.content, unsafe_allow_html=True)
-                            st.session_state.messages.append({"role": "assistant", "content": message.content})
-                    elif message.role == "json":
-                        with st.chat_message("assistant", avatar=assistant_image_url):
-                            st.json(message.content, expanded=2)
-                    elif message.role == "chart":
-                        with st.chat_message("assistant", avatar=assistant_image_url):
-                            st.image(message.content,use_container_width=True)
-                            time.sleep(3)
+    # Run the assistant response as a background job; its tokens are rendered as they are streamed
+    print("Executing Agent: " + st.session_state.agent.name)
+    try:
+        st.session_state.active_job = ag_jobs.job_queue.submit_turn(
+            st.session_state.user_id, st.session_state.agent, messages
+        )
+    except ag_jobs.JobLimitError as e:
+        # Not recorded, so the same message can be sent again
+        st.warning(str(e))
+    else:
+        # Update last_user_message and add user message to messages only once the turn is queued
+        st.session_state.last_user_message = user_message
+        st.session_state.messages.append(user_turn)
+        # Rerun so the chat input is rendered disabled while the turn runs
+        st.rerun()
+
+render_active_job()
@@ -0,0 +1,81 @@
+import asyncio
+import threading
+
+import pytest
+from openai import AsyncOpenAI
+
+import agents.async_runtime as async_runtime
+import agents.llm_cache as llm_cache
+import agents.log_cache as log_cache
+import agents.splunk as splunk
+import agents.troubleshooting as troubleshooting
+import agents.turn as turn
+from agents.manager import manager_agent
+from agents.sop import sop_catalog
+from agents.writer import resolution_writer
+from benchmarks.mock_llm import MockLLMServer
+from benchmarks.stub_splunk import StubSplunkServer
+
+ORDER = "190000000084,9559578,AO,CREQ,AOi42501070329122268949a1,0V168ZENE6FB5IL5K9385QEXD,i41943fe35e5d12252000769112b696Iar70000F999,Failed,1/7/2025 15:30,Failed,FAILED - NONRETRY,NBP,OPEN"
+
+
+@pytest.fixture
+def services(database, monkeypatch, tmp_path):
+    """Mock model server and stub splunk, with the completion and NBP log caches under tmp_path."""
+    llm = MockLLMServer(latency=0.01).start()
+    stub_splunk = StubSplunkServer(latency=0).start()
+    client = AsyncOpenAI(api_key="test", base_url=llm.base_url)
+
+    monkeypatch.setattr(async_runtime, "get_async_client", lambda: client)
+    monkeypatch.setattr(turn, "MISTRAL_MODEL", "mock")
+    monkeypatch.setattr(llm_cache, "completion_cache", llm_cache.CompletionCache(path=str(tmp_path / "llm.sqlite3")))
+    monkeypatch.setattr(log_cache, "nbp_log_cache", log_cache.NbpLogCache(path=str(tmp_path / "nbp.sqlite3")))
+    monkeypatch.setattr(splunk, "_splunk_client", splunk.SplunkClient(url=stub_splunk.url))
+    monkeypatch.setattr(resolution_writer, "_insert", database.insert_resolutions)
+    yield
+    resolution_writer.flush()
+    llm.stop()
+    stub_splunk.stop()
+
+
+def test_turn_progresses_while_another_reloads_the_sop_catalog(services, monkeypatch):
+    loading = threading.Event()
+    release = threading.Event()
+    loaded = threading.Event()
+    load = sop_catalog._loader
+
+    def held_loader():
+        loading.set()
+        release.wait(5)
+        loaded.set()
+        return load()
+
+    # Without the prefetch the troubleshooting turn reloads the catalog while building its first request
+    monkeypatch.setattr(troubleshooting, "TROUBLESHOOT_PREFETCH", False)
+    monkeypatch.setattr(sop_catalog, "_loader", held_loader)
+    sop_catalog.invalidate()
+
+    async def scenario():
+        held = asyncio.create_task(async_runtime.run_full_turn_async(
+            troubleshooting.troubleshooting_agent,
+            [{"role": "user", "content": troubleshooting.order_header + "\n" + ORDER}],
+        ))
+        assert await asyncio.to_thread(loading.wait, 10)
+
+        # The event loop must stay free while the catalog query is held
+        other = await asyncio.wait_for(
+            async_runtime.run_full_turn_async(manager_agent, [{"role": "user", "content": "What happened to order 190000000084?"}]),
+            timeout=10,
+        )
+        assert not loaded.is_set() and not held.done()
+
+        release.set()
+        return other, await asyncio.wait_for(held, timeout=10)
+
+    try:
+        other, held = asyncio.run(scenario())
+    finally:
+        release.set()
+
+    assert "190000000084" in other.messages[-1].content
+    assert held.messages[-1].content
@@ -0,0 +1,46 @@
+import json
+from pathlib import Path
+
+from agents.manager import manager_agent
+from agents.troubleshooting import order_header, troubleshooting_agent
+from agents.turn import Turn
+
+SAMPLE_ORDERS = Path(__file__).parent.parent / "sample_orders.csv"
+
+
+def read_sample_orders():
+    with open(SAMPLE_ORDERS) as f:
+        return [line.strip() for line in f.readlines()[1:] if line.strip()]
+
+
+def prefix(agent, messages):
+    """The system message and tool schemas of the next model call, as the bytes sent to the server."""
+    request = Turn(agent, messages).next_request()
+    assert request["messages"][0]["role"] == "system"
+    return json.dumps(request["messages"][0]), json.dumps(request["tools"])
+
+
+def test_manager_prefix_is_identical_across_turns_and_orders(database):
+    first_turn = [{"role": "user", "content": "What happened to order 190000000080?"}]
+    later_turn = first_turn + [
+        {"role": "assistant", "content": "Order 190000000080 failed because of an internal server error in NBP."},
+        {"role": "user", "content": "And MOk42501300904219745e55a0?"},
+    ]
+    # Long enough to be compacted, which must never touch the system prompt
+    compacted_turn = later_turn + [
+        {"role": "assistant", "content": "x" * 100000},
+        {"role": "user", "content": "Summarize orders 190000000004 and 190000000002"},
+    ]
+
+    expected = prefix(manager_agent, first_turn)
+    assert prefix(manager_agent, later_turn) == expected
+    assert prefix(manager_agent, compacted_turn) == expected
+
+
+def test_troubleshooting_prefix_is_identical_across_orders(database):
+    first, second = read_sample_orders()[:2]
+
+    expected = prefix(troubleshooting_agent, [{"role": "user", "content": order_header + "\n" + first}])
+    # The SOP catalog is part of the prefix, not a per-order fallback message
+    assert "SOP catalog:" in expected[0] and "SOP catalog: unavailable" not in expected[0]
+    assert prefix(troubleshooting_agent, [{"role": "user", "content": order_header + "\n" + second}]) == expected